@@ -1,8 +1,72 @@
 from django.contrib import admin
 from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.utils.functional import cached_property
 
 from .models import Category, Page, UserProfile
 
+# filtered changelists count at most this many rows
+COUNT_LIMIT = 10000
+
+
+def estimate_count(queryset):
+    """
+    Row count of a whole table from the database statistics,
+    without reading the table
+    :param queryset: an unfiltered queryset
+    :return: the estimated number of rows
+    """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+            row = cursor.fetchone()
+            if row and row[0] > 0:
+                return row[0]
+        elif connection.vendor == 'sqlite':
+            try:
+                # filled by ANALYZE, the first number of stat is the row count
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+            except DatabaseError:
+                pass
+        # ids are mostly dense, the highest one is a good upper bound
+        cursor.execute("SELECT MAX({}) FROM {}".format(
+            connection.ops.quote_name(queryset.model._meta.pk.column),
+            connection.ops.quote_name(table)))
+        return cursor.fetchone()[0] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never counts a whole table: unfiltered changelists use
+    estimate_count(), filtered ones stop counting at COUNT_LIMIT
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return estimate_count(queryset)
+        return queryset.order_by().values('pk')[:COUNT_LIMIT].count()
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist in constant query count and time: estimated counts, no
+    full result count, and 'older' links walking the table by id
+    (?id__lt=<last id>) instead of deep page offsets
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-id',)
+    change_list_template = 'admin/rango/large_table_change_list.html'
+
 
 class PageInline(admin.TabularInline):
     model = Page
@@ -14,10 +78,11 @@ class UserProfileAdmin(admin.ModelAdmin):
         ("Profile Infos", {'fields': ['website', 'picture', ]}),
     ]
     list_display = ('get_username', 'get_email', 'website', 'picture')
-    search_fields = ['get_username', 'get_email']
+    list_select_related = ('user', )
+    search_fields = ['user__username', 'user__email']
 
 
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(LargeTableAdmin):
     fieldsets = [
         ("Primary Infos", {'fields': ['name', 'slug', ]}),
         ("Statistics", {'fields': ['views', 'likes', ]}),
@@ -27,15 +92,30 @@ class CategoryAdmin(admin.ModelAdmin):
     search_fields = ['name']
     prepopulated_fields = {"slug": ("name",)}
 
+    def get_queryset(self, request):
+        # counted in the changelist query, for the displayed rows only
+        page_total = (Page.objects.filter(category=OuterRef('pk')).order_by()
+                      .values('category').annotate(total=Count('*')).values('total'))
+        return super(CategoryAdmin, self).get_queryset(request).annotate(
+            page_total=Subquery(page_total, output_field=IntegerField()))
+
+    def pages_count(self, obj):
+        return obj.page_total or 0
+
+    pages_count.admin_order_field = 'page_total'
+
 
-class PageAdmin(admin.ModelAdmin):
+class PageAdmin(LargeTableAdmin):
     fieldsets = [
         ("Primary Infos", {'fields': ['title', 'url', ]}),
         ("Statistics", {'fields': ['views', ]}),
         ("Category", {'fields': ['category', ]})
     ]
     list_display = ('title', 'url', 'views', 'category')
-    list_filter = ['category']
+    list_select_related = ('category', )
+    # a select or a filter listing every category does not scale
+    raw_id_fields = ['category']
+    search_fields = ['title', 'category__name']
 
 
 admin.site.register(Category, CategoryAdmin)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class RangoConfig(AppConfig):
     name = 'rango'
+
+    def ready(self):
+        # connect the signal receivers, register the jobs and checks
+        from . import checks, signals, tasks  # noqa: F401
@@ -0,0 +1,180 @@
+import asyncio
+import io
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core import signals
+from django.core.handlers.wsgi import WSGIHandler, get_script_name
+from django.db import close_old_connections
+from django.urls import set_script_prefix
+
+from rango.deferred import ASYNC_ENVIRON_KEY, DeferredSearch
+from rango.metrics import record_search
+from rango.webhose_async import cached_run_query_async
+from rango.webhose_search import WEBHOSE_ROOT_URL
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+# describe the empty body of a DeferredSearch, not the rendered page
+BODY_HEADERS = ('content-length', 'etag')
+
+
+def build_environ(scope, body):
+    """
+    WSGI environ of an ASGI HTTP request, for Django 1.11's handler
+    :param scope: ASGI http scope
+    :param body: request body bytes
+    :return: dict
+    """
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        # WSGI strings are bytes decoded as latin-1
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        ASYNC_ENVIRON_KEY: True,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            environ[name] = value
+        else:
+            key = 'HTTP_' + name
+            environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+def response_headers(response):
+    headers = [(name.encode('latin-1'), str(value).encode('latin-1')) for name, value in response.items()]
+    for cookie in response.cookies.values():
+        headers.append((b'Set-Cookie', cookie.output(header='').strip().encode('latin-1')))
+    return headers
+
+
+class DjangoASGIApplication(object):
+    """
+    ASGI application for Django 1.11, which only speaks WSGI.
+
+    Requests go through the usual middleware and views in a pool of
+    RANGO_ASGI_THREADS worker threads. A search view returns a
+    DeferredSearch instead of waiting on webhose: the search is then
+    awaited here on the event loop and only the final rendering takes a
+    thread again, so in-flight searches cost coroutines, not threads.
+    """
+
+    def __init__(self, threads=None, webhose_url=WEBHOSE_ROOT_URL):
+        self.handler = WSGIHandler()
+        self.executor = ThreadPoolExecutor(max_workers=threads or getattr(settings, 'RANGO_ASGI_THREADS', 10))
+        self.webhose_url = webhose_url
+
+    async def in_thread(self, func, *args):
+        """
+        Run blocking Django code (ORM, sessions, templates) in the pool
+        :param func:
+        :param args:
+        :return: what func returned
+        """
+        return await asyncio.get_event_loop().run_in_executor(self.executor, partial(self._call, func, *args))
+
+    @staticmethod
+    def _call(func, *args):
+        try:
+            return func(*args)
+        finally:
+            # connections belong to the pool thread, do not leave them open between calls
+            close_old_connections()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError("Unsupported ASGI scope type {!r}".format(scope['type']))
+
+        body = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+
+        response = await self.in_thread(self.get_response, build_environ(scope, b''.join(body)))
+        if isinstance(response, DeferredSearch):
+            response = await self.complete_search(response)
+        try:
+            await self.send_response(response, send)
+        finally:
+            await self.in_thread(response.close)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def get_response(self, environ):
+        # what WSGIHandler.__call__ does, short of starting the response
+        set_script_prefix(get_script_name(environ))
+        signals.request_started.send(sender=self.handler.__class__, environ=environ)
+        request = self.handler.request_class(environ)
+        return self.handler.get_response(request)
+
+    async def complete_search(self, deferred):
+        start = time.perf_counter()
+        results = await cached_run_query_async(deferred.query, root_url=self.webhose_url)
+        record_search(deferred.view_name or 'unmatched', time.perf_counter() - start)
+        response = await self.in_thread(deferred.complete, results)
+        # the middleware already ran on the deferred response: keep its cookies and headers
+        for name, value in deferred.items():
+            if name.lower() not in BODY_HEADERS and not response.has_header(name):
+                response[name] = value
+        if not response.streaming:
+            response['Content-Length'] = str(len(response.content))
+        for name, cookie in deferred.cookies.items():
+            response.cookies[name] = cookie
+        await self.in_thread(deferred.close)
+        return response
+
+    async def send_response(self, response, send):
+        await send({'type': 'http.response.start',
+                    'status': response.status_code,
+                    'headers': response_headers(response)})
+        if not response.streaming:
+            await send({'type': 'http.response.body', 'body': response.content})
+            return
+        # exports and media are produced in the pool, one chunk at a time
+        chunks = iter(response)
+        while True:
+            chunk = await self.in_thread(next, chunks, _END)
+            if chunk is _END:
+                break
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+def get_asgi_application():
+    return DjangoASGIApplication()
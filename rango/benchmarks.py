@@ -0,0 +1,76 @@
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+def percentile(samples, pct):
+    """
+    nearest-rank percentile of a list of numbers
+    :param samples:
+    :param pct: between 0 and 100
+    :return:
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(int(round(pct / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(samples, elapsed=None):
+    """
+    summary statistics of latency samples
+    :param samples: durations in seconds
+    :param elapsed: wall time of the whole run, for throughput
+    :return: dict with latencies in milliseconds
+    """
+    count = len(samples)
+    elapsed = elapsed if elapsed is not None else sum(samples)
+    return {
+        'count': count,
+        'throughput': round(count / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(sum(samples) / count * 1000, 3) if count else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+class Stopwatch(object):
+    """
+    Context manager collecting the duration of each block it wraps
+    """
+
+    def __init__(self):
+        self.samples = []
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.samples.append(time.perf_counter() - self._start)
+
+
+@contextmanager
+def test_database(keepdb=False, name=None):
+    """
+    Run the block against a freshly migrated test database, leaving the
+    development database alone, with the test client allowed to connect
+    :param keepdb:
+    :param name: file of the test database, SQLite ones are in memory by default
+    """
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    old_test_name = connection.settings_dict['TEST'].get('NAME')
+    if name is not None:
+        connection.settings_dict['TEST']['NAME'] = name
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+        teardown_test_environment()
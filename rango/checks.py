@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+PER_PROCESS_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    ETags and cached pages rely on content versions kept in the cache: a
+    version bumped in one worker must be seen by the others
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PER_PROCESS_CACHES and not settings.DEBUG:
+        return [Warning(
+            "The default cache ({}) is not shared between processes".format(backend),
+            hint="Workers would keep answering 304 and serving cached pages after another "
+                 "worker changed the content: use a file based cache, memcached or redis, "
+                 "or run a single worker.",
+            id='rango.W001',
+        )]
+    return []
@@ -1,4 +1,6 @@
 cat_name_max_length = 128
 page_title_max_length = cat_name_max_length
 url_max_length = 200
-integer_default_views_and_likes = 0
\ No newline at end of file
+integer_default_views_and_likes = 0
+profiles_per_page = 25
+profiles_max_per_page = 100
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.http import HttpResponse
+
+# set in the WSGI environ of requests served by rango.asgi
+ASYNC_ENVIRON_KEY = 'rango.async'
+
+
+class DeferredSearch(HttpResponse):
+    """
+    What search views return under ASGI: the request went through the
+    middleware and the view in a worker thread, the ASGI application
+    awaits the search on its event loop, then calls complete(results)
+    in a worker thread for the actual response.
+    """
+
+    def __init__(self, query, complete):
+        super(DeferredSearch, self).__init__()
+        self.query = query
+        self.complete = complete
+        # set by MetricsMiddleware, the search is timed under it
+        self.view_name = None
+
+
+def can_defer_search(request):
+    # only webhose searches wait on the network, local ones are quick queries
+    return (request.META.get(ASYNC_ENVIRON_KEY) is True and
+            getattr(settings, 'RANGO_SEARCH_BACKEND', 'webhose') == 'webhose')
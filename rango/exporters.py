@@ -0,0 +1,96 @@
+import csv
+import json
+import zlib
+
+from .models import Category, Page
+
+# (record type, model, exported fields), categories first so that
+# importers meet a category before its pages
+EXPORTED_TABLES = [
+    ('category', Category, ['id', 'name', 'slug', 'views', 'likes']),
+    ('page', Page, ['id', 'category_id', 'title', 'url', 'views']),
+]
+CSV_COLUMNS = ['type', 'id', 'category_id', 'name', 'slug', 'title', 'url', 'views', 'likes']
+CONTENT_TYPES = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv'}
+FORMATS = list(CONTENT_TYPES)
+
+
+def iter_table(model, fields, chunk_size=2000):
+    """
+    Walk a table in primary key order, chunk_size rows per query,
+    each query starting after the last key seen instead of using an offset
+    :param model:
+    :param fields: field names, starting with 'id'
+    :param chunk_size:
+    :return: generator of value tuples
+    """
+    last_id = 0
+    while True:
+        count = 0
+        for row in (model.objects.filter(id__gt=last_id).order_by('id')
+                    .values_list(*fields)[:chunk_size].iterator()):
+            count += 1
+            last_id = row[0]
+            yield row
+        if count < chunk_size:
+            return
+
+
+def iter_records(chunk_size=2000):
+    for record_type, model, fields in EXPORTED_TABLES:
+        for row in iter_table(model, fields, chunk_size):
+            record = {'type': record_type}
+            record.update(zip(fields, row))
+            yield record
+
+
+class _Echo(object):
+    # lets csv.writer hand back the formatted line instead of writing it
+    def write(self, value):
+        return value
+
+
+def iter_lines(export_format='jsonl', chunk_size=2000):
+    """
+    :param export_format: 'jsonl' or 'csv'
+    :param chunk_size: rows per query
+    :return: generator of text lines, newline included
+    """
+    records = iter_records(chunk_size)
+    if export_format == 'csv':
+        writer = csv.DictWriter(_Echo(), CSV_COLUMNS)
+        yield writer.writerow(dict(zip(CSV_COLUMNS, CSV_COLUMNS)))
+        for record in records:
+            yield writer.writerow(record)
+    else:
+        for record in records:
+            yield json.dumps(record) + '\n'
+
+
+def iter_encoded(lines, compress=False, buffer_size=64 * 1024):
+    """
+    Encode lines to UTF-8 in blocks of about buffer_size bytes,
+    gzip-compressed on the fly if asked to
+    :param lines:
+    :param compress:
+    :param buffer_size:
+    :return: generator of bytes
+    """
+    # wbits=31 writes a gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= buffer_size:
+            block = b''.join(buffer)
+            buffer, size = [], 0
+            block = compressor.compress(block) if compressor else block
+            if block:
+                yield block
+    block = b''.join(buffer)
+    if compressor:
+        block = compressor.compress(block) + compressor.flush()
+    if block:
+        yield block
@@ -0,0 +1,110 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.urls import reverse
+
+from .models import Category, Page
+
+INDEX_TABLE = 'rango_search_index'
+# bm25 weights of the title and url columns
+TITLE_WEIGHT = 10.0
+URL_WEIGHT = 1.0
+
+_word_re = re.compile(r'\w+', re.UNICODE)
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_expression(search_terms):
+    """
+    Turn user input into an FTS5 query: every word must match,
+    the last one as a prefix so results follow the typing
+    :param search_terms:
+    :return: the MATCH expression, or '' when there is nothing to look for
+    """
+    words = _word_re.findall(search_terms.lower())
+    if not words:
+        return ''
+    terms = ['"{}"'.format(word) for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _category_result(rowid, title, slug):
+    return {'title': title,
+            'link': reverse('rango:show_category', args=[slug]),
+            'summary': 'Category',
+            'kind': 'category',
+            'id': rowid // 2}
+
+
+def _page_result(rowid, title, url):
+    return {'title': title,
+            'link': reverse('rango:goto', args=[rowid // 2]),
+            'summary': url,
+            'kind': 'page',
+            'id': rowid // 2}
+
+
+def search_local(search_terms, size=10):
+    """
+    return categories and pages matching the search terms, best first
+    :param search_terms:
+    :param size:
+    :return: a list of result dicts shaped like webhose_search.run_query ones
+    """
+    if not is_available():
+        return _search_fallback(search_terms, size)
+
+    expression = build_match_expression(search_terms)
+    if not expression:
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT rowid, title, url, slug FROM {table} "
+            "WHERE {table} MATCH %s "
+            "ORDER BY bm25({table}, %s, %s) LIMIT %s".format(table=INDEX_TABLE),
+            [expression, TITLE_WEIGHT, URL_WEIGHT, size])
+        rows = cursor.fetchall()
+
+    return [_category_result(rowid, title, slug) if rowid % 2 == 0
+            else _page_result(rowid, title, url)
+            for rowid, title, url, slug in rows]
+
+
+def _search_fallback(search_terms, size):
+    # other databases have no FTS5 table, match words with LIKE scans instead
+    words = _word_re.findall(search_terms)
+    if not words:
+        return []
+    category_filter, page_filter = Q(), Q()
+    for word in words:
+        category_filter &= Q(name__icontains=word)
+        page_filter &= Q(title__icontains=word) | Q(url__icontains=word)
+    results = [_category_result(pk * 2, name, slug) for pk, name, slug in
+               Category.objects.filter(category_filter).values_list('pk', 'name', 'slug')[:size]]
+    results += [_page_result(pk * 2 + 1, title, url) for pk, title, url in
+                Page.objects.filter(page_filter).values_list('pk', 'title', 'url')[:size - len(results)]]
+    return results
+
+
+def rebuild_index():
+    """
+    Refill the index from the rango tables in bulk
+    :return: number of indexed rows
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM {}".format(INDEX_TABLE))
+        cursor.execute(
+            "INSERT INTO {}(rowid, title, url, slug) "
+            "SELECT id * 2, name, '', slug FROM rango_category".format(INDEX_TABLE))
+        cursor.execute(
+            "INSERT INTO {}(rowid, title, url, slug) "
+            "SELECT id * 2 + 1, title, url, '' FROM rango_page".format(INDEX_TABLE))
+        cursor.execute("INSERT INTO {0}({0}) VALUES ('optimize')".format(INDEX_TABLE))
+        cursor.execute("SELECT count(*) FROM {}".format(INDEX_TABLE))
+        return cursor.fetchone()[0]
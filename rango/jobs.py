@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# name: (function, max attempts)
+_tasks = {}
+
+
+def task(name, max_attempts=3):
+    """
+    Register a function as a job, run by the workers with the keyword
+    arguments given to enqueue(); what it returns must be JSON serializable
+    :param name: job name, the same in every process
+    :param max_attempts: runs before the job is failed
+    :return: a decorator
+    """
+    def register(function):
+        _tasks[name] = (function, max_attempts)
+        return function
+    return register
+
+
+def enqueue(name, delay=0, **payload):
+    """
+    Queue a job for the workers
+    :param name: a registered job name
+    :param delay: seconds before it may run
+    :param payload: keyword arguments of the job, JSON serializable
+    :return: the Job
+    """
+    function, max_attempts = _tasks[name]
+    return Job.objects.create(name=name, payload=json.dumps(payload), max_attempts=max_attempts,
+                              run_at=timezone.now() + timedelta(seconds=delay))
+
+
+def claim(worker, batch=10):
+    """
+    Take the next job due, making sure no other worker took it
+    :param worker: name of the worker
+    :param batch: candidates looked at in one query
+    :return: the Job, now running, or None
+    """
+    now = timezone.now()
+    candidates = (Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+                  .order_by('run_at', 'id').values_list('id', flat=True)[:batch])
+    for pk in candidates:
+        # only one worker can move it out of the queued state
+        if Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+                status=Job.RUNNING, worker=worker, started=now, attempts=F('attempts') + 1):
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run(job):
+    """
+    Run a claimed job, storing its result, or queueing it again
+    with an exponential backoff if it has attempts left
+    :param job: a running Job
+    :return: the Job
+    """
+    try:
+        function, max_attempts = _tasks[job.name]
+        result = function(**json.loads(job.payload))
+    except Exception:
+        logger.exception("Job %s failed, attempt %s of %s", job, job.attempts, job.max_attempts)
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + timedelta(seconds=2 ** job.attempts)
+        else:
+            job.status = Job.FAILED
+            job.finished = timezone.now()
+    else:
+        job.status = Job.DONE
+        job.result = json.dumps(result)
+        job.finished = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'run_at', 'finished'])
+    return job
+
+
+# seconds between two looks for the jobs of dead workers
+STALE_CHECK_INTERVAL = 60
+
+
+def requeue_stale(timeout):
+    """
+    Queue again the jobs of workers which died running them, failing
+    those without attempts left: they may be what kills the workers
+    :param timeout: seconds after which a running job is considered lost
+    :return: number of jobs queued again
+    """
+    now = timezone.now()
+    lost = Job.objects.filter(status=Job.RUNNING, started__lt=now - timedelta(seconds=timeout))
+    failed = lost.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, finished=now, error='The worker running the job was lost')
+    if failed:
+        logger.warning("%s jobs failed, their workers were lost on every attempt", failed)
+    return lost.filter(attempts__lt=F('max_attempts')).update(status=Job.QUEUED, run_at=now, worker='')
+
+
+def purge(days):
+    """
+    Forget finished jobs
+    :param days: age of the jobs to delete
+    :return: number of jobs deleted
+    """
+    deleted, per_model = Job.objects.filter(status__in=[Job.DONE, Job.FAILED],
+                                            finished__lt=timezone.now() - timedelta(days=days)).delete()
+    return deleted
+
+
+def work(poll_interval=1.0, stop=None, max_jobs=None, stale_timeout=600):
+    """
+    Run jobs until stop() returns True, waiting poll_interval seconds
+    whenever the queue is empty, and queueing again the jobs of
+    workers which died every STALE_CHECK_INTERVAL seconds
+    :param poll_interval:
+    :param stop: function without arguments, or None to run forever
+    :param max_jobs: return after this many jobs, None for no limit
+    :param stale_timeout: seconds after which a running job is considered lost
+    :return: number of jobs run
+    """
+    worker = '{}:{}'.format(socket.gethostname(), os.getpid())
+    count = 0
+    checked_at = time.monotonic()
+    while not (stop and stop()) and (max_jobs is None or count < max_jobs):
+        if time.monotonic() - checked_at > STALE_CHECK_INTERVAL:
+            checked_at = time.monotonic()
+            requeue_stale(stale_timeout)
+        job = claim(worker)
+        if job is None:
+            if poll_interval <= 0:
+                break
+            # do not keep a connection open while idle
+            connection.close()
+            time.sleep(poll_interval)
+            continue
+        run(job)
+        count += 1
+    return count
+
+
+def job_state(job):
+    """
+    :param job:
+    :return: what the status endpoint tells about a job
+    """
+    return {
+        'key': job.key,
+        'name': job.name,
+        'status': job.status,
+        'attempts': job.attempts,
+        'result': json.loads(job.result) if job.result else None,
+        'retry_after': getattr(settings, 'RANGO_JOB_POLL_INTERVAL', 1),
+    }
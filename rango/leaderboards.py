@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+from .models import Category, Page
+from .routers import PRIMARY
+from .versions import INDEX, get_version
+
+
+class Leaderboard(object):
+    """
+    The rows of a model with the highest value of a counter, kept up to
+    date in process from the changes reported through offer().
+
+    It is loaded from the database on first use and reloaded when the
+    INDEX version moved because of another worker, every
+    RANGO_LEADERBOARD_REFRESH seconds, or as soon as a change cannot be
+    applied incrementally.
+    """
+
+    def __init__(self, model, score_field, fields):
+        self.model = model
+        self.score_field = score_field
+        self.fields = ('id',) + tuple(fields) + (score_field,)
+        self.entry_class = namedtuple('Top' + model.__name__, self.fields)
+        self._lock = threading.Lock()
+        self._entries = None
+        self._loaded_at = 0
+        # INDEX version the entries are up to date with
+        self._version = None
+
+    @property
+    def capacity(self):
+        return getattr(settings, 'RANGO_LEADERBOARD_SIZE', 10)
+
+    def _score(self, entry):
+        return getattr(entry, self.score_field)
+
+    def _sort_key(self, entry):
+        return -self._score(entry), entry.id
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = None
+
+    def queryset(self):
+        # cached until the next change, which may not have reached the replicas
+        return (self.model.objects.using(PRIMARY).order_by('-' + self.score_field, 'id')
+                .values_list(*self.fields)[:self.capacity])
+
+    def rebuild(self, version=None):
+        """
+        :param version: INDEX version read before loading
+        :return: the entries just loaded
+        """
+        entries = [self.entry_class(*row) for row in self.queryset()]
+        with self._lock:
+            self._entries = entries
+            self._loaded_at = time.monotonic()
+            self._version = version
+        return entries
+
+    def caught_up(self, version):
+        """
+        A change already offered to the board moved INDEX to version:
+        the entries stay valid unless another change came in between
+        :param version: INDEX version returned by the bump
+        """
+        with self._lock:
+            if self._entries is not None and self._version is not None and version == self._version + 1:
+                self._version = version
+
+    def top(self, count):
+        """
+        :param count: at most RANGO_LEADERBOARD_SIZE
+        :return: the count best entries, best first
+        """
+        refresh = getattr(settings, 'RANGO_LEADERBOARD_REFRESH', 60)
+        version = get_version(INDEX)
+        # other threads may invalidate the board at any time, work on one list
+        with self._lock:
+            entries, loaded_at, seen = self._entries, self._loaded_at, self._version
+        if entries is None or seen != version or time.monotonic() - loaded_at > refresh:
+            entries = self.rebuild(version)
+        return entries[:count]
+
+    def offer(self, rows):
+        """
+        Report current values of changed rows
+        :param rows: tuples ordered like self.fields
+        """
+        with self._lock:
+            if self._entries is None:
+                return
+            entries = {entry.id: entry for entry in self._entries}
+            for row in rows:
+                entry = self.entry_class(*row)
+                previous = entries.get(entry.id)
+                if previous is not None and self._score(entry) < self._score(previous):
+                    # a row outside the board may now rank higher, start over
+                    self._entries = None
+                    return
+                entries[entry.id] = entry
+            self._entries = sorted(entries.values(), key=self._sort_key)[:self.capacity]
+
+    def offer_ids(self, ids):
+        """
+        Read the given rows back from the database and offer them
+        :param ids: primary keys
+        """
+        ids = list(ids)
+        # keep under SQLite's bound parameters limit
+        for start in range(0, len(ids), 500):
+            if self._entries is None:
+                return
+            self.offer(self.model.objects.filter(id__in=ids[start:start + 500])
+                       .values_list(*self.fields))
+
+    def offer_instance(self, instance):
+        self.offer([tuple(getattr(instance, field) for field in self.fields)])
+
+    def discard(self, pk):
+        with self._lock:
+            if self._entries is not None and any(entry.id == pk for entry in self._entries):
+                self._entries = None
+
+
+top_categories = Leaderboard(Category, 'likes', ['name', 'slug'])
+top_pages = Leaderboard(Page, 'views', ['title', 'url'])
+
+
+def index_bumped(version):
+    """
+    Tell the leaderboards a change they were offered moved INDEX to version
+    :param version:
+    """
+    for board in (top_categories, top_pages):
+        board.caught_up(version)
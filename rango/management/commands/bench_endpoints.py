@@ -0,0 +1,158 @@
+import io
+import json
+import time
+from contextlib import ExitStack
+from wsgiref.util import setup_testing_defaults
+
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from rango import urls as rango_urls
+from rango.benchmarks import Stopwatch, summarize, test_database
+from rango.models import Category, Job, Page
+from rango.tracking import page_views
+
+BENCH_USERNAME = 'rango_bench'
+BENCH_PASSWORD = 'rango-password'
+BENCH_HOST = 'testserver'
+# they change likes and views, only benchmarked on a --fresh database
+WRITE_ENDPOINTS = {'like_category', 'goto'}
+
+
+class Command(BaseCommand):
+    help = ("Drive every rango URL through the WSGI application and report throughput, "
+            "latency percentiles and queries per request as JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100,
+                            help="requests per endpoint")
+        parser.add_argument('--warmup', type=int, default=5,
+                            help="untimed requests per endpoint first")
+        parser.add_argument('--output', help="write the JSON report to this file")
+        parser.add_argument('--fresh', action='store_true',
+                            help="run on a throwaway database filled by generate_dataset")
+        parser.add_argument('--categories', type=int, default=1000)
+        parser.add_argument('--pages', type=int, default=20000)
+        parser.add_argument('--users', type=int, default=100)
+
+    def handle(self, *args, **options):
+        with override_settings(ALLOWED_HOSTS=[BENCH_HOST]):
+            if options['fresh']:
+                with test_database():
+                    call_command('generate_dataset', categories=options['categories'],
+                                 pages=options['pages'], users=options['users'], stdout=io.StringIO())
+                    report = self.run(options)
+            else:
+                report = self.run(options)
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def run(self, options):
+        category = Category.objects.order_by('-likes').first()
+        page = Page.objects.order_by('-views').first()
+        if category is None or page is None:
+            raise CommandError("No data to benchmark, run generate_dataset first or use --fresh")
+
+        # a staff user and a finished job for the status endpoint, both removed afterwards
+        user = User.objects.filter(username=BENCH_USERNAME).first()
+        created = user is None
+        if created:
+            user = User.objects.create_user(BENCH_USERNAME, password=BENCH_PASSWORD, is_staff=True)
+        client = Client()
+        client.force_login(user)
+        cookie = '; '.join('{}={}'.format(key, morsel.value) for key, morsel in client.cookies.items())
+        job = Job.objects.create(name='search', status=Job.DONE, result='[]', run_at=timezone.now())
+        try:
+            return self.bench_urls(options, category, page, user, cookie, job)
+        finally:
+            job.delete()
+            client.logout()
+            if created:
+                user.delete()
+
+    def bench_urls(self, options, category, page, user, cookie, job):
+        arguments = {
+            'category_name_slug': category.slug,
+            'category_slug_name': category.slug,
+            'page_id': page.id,
+            'username': user.username,
+            'key': job.key,
+        }
+        query_strings = {
+            'like_category': 'category_id={}'.format(category.id),
+            'suggest_category': 'suggestion={}'.format(category.name[:2]),
+        }
+
+        handler = WSGIHandler()
+        report = {}
+        for pattern in rango_urls.urlpatterns:
+            name = pattern.name
+            if name in WRITE_ENDPOINTS and not options['fresh']:
+                self.stderr.write("Skipping rango:{}, it writes to the database: use --fresh".format(name))
+                continue
+            unknown = set(pattern.regex.groupindex) - set(arguments)
+            if unknown:
+                self.stderr.write("Skipping rango:{}, no value for {}".format(name, ', '.join(sorted(unknown))))
+                continue
+            kwargs = {key: arguments[key] for key in pattern.regex.groupindex}
+            path = reverse('rango:' + name, kwargs=kwargs)
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': path,
+                'QUERY_STRING': query_strings.get(name, ''),
+                'HTTP_COOKIE': cookie,
+                'HTTP_HOST': BENCH_HOST,
+                'SERVER_NAME': BENCH_HOST,
+            }
+            report['rango:' + name] = self.bench(handler, environ,
+                                                 options['requests'], options['warmup'])
+        # write buffered page views to this database, not at exit
+        page_views.flush()
+        return report
+
+    def bench(self, handler, environ, requests, warmup):
+        statuses = {}
+
+        def call():
+            request_environ = dict(environ)
+            setup_testing_defaults(request_environ)
+
+            def start_response(status, headers, exc_info=None):
+                statuses[status.split()[0]] = statuses.get(status.split()[0], 0) + 1
+
+            response = handler(request_environ, start_response)
+            for _ in response:
+                pass
+            response.close()
+
+        for _ in range(warmup):
+            call()
+        statuses.clear()
+
+        stopwatch = Stopwatch()
+        queries = 0
+        start = time.perf_counter()
+        for _ in range(requests):
+            # replicas included
+            with ExitStack() as stack:
+                captured = [stack.enter_context(CaptureQueriesContext(connection))
+                            for connection in connections.all()]
+                with stopwatch:
+                    call()
+            queries += sum(len(queries_of) for queries_of in captured)
+        result = summarize(stopwatch.samples, time.perf_counter() - start)
+        result['path'] = environ['PATH_INFO']
+        result['statuses'] = statuses
+        result['queries_per_request'] = round(queries / requests, 2)
+        return result
@@ -0,0 +1,80 @@
+import json
+import time
+import urllib.parse
+import urllib.request
+
+from django.core.management.base import BaseCommand
+
+from rango.benchmarks import Stopwatch, summarize
+from rango.webhose_search import ConnectionPool, read_webhose_key, run_queries, run_query
+from rango.webhose_stub import StubWebhoseServer
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the webhose client against a local stub server replaying "
+            "webhose_search_result_example.json with injected latency")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help="number of queries per scenario")
+        parser.add_argument('--latency', type=float, default=50,
+                            help="latency injected by the stub server, in milliseconds")
+        parser.add_argument('--batch', type=int, default=10,
+                            help="queries sent together through run_queries")
+
+    def handle(self, *args, **options):
+        server = StubWebhoseServer(latency=options['latency'] / 1000.0).start()
+        try:
+            report = {
+                'latency_ms': options['latency'],
+                'urlopen': self.bench_urlopen(server, options['requests']),
+                'pooled': self.bench_pooled(server, options['requests']),
+                'batch': self.bench_batch(server, options['requests'], options['batch']),
+            }
+        finally:
+            server.stop()
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def bench_urlopen(self, server, requests):
+        # what run_query used to do: a new connection for every query
+        before = server.connections
+        stopwatch = Stopwatch()
+        start = time.perf_counter()
+        for i in range(requests):
+            url = '{}?{}'.format(server.root_url, urllib.parse.urlencode(
+                {'token': read_webhose_key(), 'format': 'json', 'q': 'query {}'.format(i)}))
+            with stopwatch:
+                json.loads(urllib.request.urlopen(url).read().decode('utf-8'))
+        result = summarize(stopwatch.samples, time.perf_counter() - start)
+        result['connections'] = server.connections - before
+        return result
+
+    def bench_pooled(self, server, requests):
+        before = server.connections
+        pool = ConnectionPool(server.root_url)
+        stopwatch = Stopwatch()
+        start = time.perf_counter()
+        for i in range(requests):
+            with stopwatch:
+                run_query('query {}'.format(i), pool=pool)
+        result = summarize(stopwatch.samples, time.perf_counter() - start)
+        result['connections'] = server.connections - before
+        pool.close()
+        return result
+
+    def bench_batch(self, server, requests, batch):
+        before = server.connections
+        pool = ConnectionPool(server.root_url, size=batch)
+        stopwatch = Stopwatch()
+        start = time.perf_counter()
+        for offset in range(0, requests, batch):
+            queries = ['query {}'.format(i) for i in range(offset, min(offset + batch, requests))]
+            with stopwatch:
+                run_queries(queries, pool=pool)
+        elapsed = time.perf_counter() - start
+        result = summarize(stopwatch.samples, elapsed)
+        # throughput in queries, latencies per batch
+        result['throughput'] = round(requests / elapsed, 1)
+        result['connections'] = server.connections - before
+        pool.close()
+        return result
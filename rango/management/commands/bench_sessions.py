@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rango.benchmarks import test_database
+
+ENGINES = ['db', 'cached_db', 'cache', 'signed_cookies']
+
+
+class Command(BaseCommand):
+    help = "Count session writes per anonymous page view for each session engine"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help="page views per engine, each loading the visits and nav fragments")
+
+    def handle(self, *args, **options):
+        report = {}
+        with test_database():
+            for store in ENGINES:
+                engine = 'django.contrib.sessions.backends.{}'.format(store)
+                with override_settings(SESSION_ENGINE=engine):
+                    report[store] = self.bench(options['requests'])
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def bench(self, requests):
+        client = Client()
+        # the pages are cached shells, the session is read and written by their fragments
+        urls = [reverse('rango:visits_fragment'), reverse('rango:nav_fragment')]
+        writes = 0
+        set_cookies = 0
+        for i in range(requests):
+            with CaptureQueriesContext(connection) as queries:
+                responses = [client.get(url) for url in urls]
+            writes += sum(1 for query in queries
+                          if 'django_session' in query['sql']
+                          and query['sql'].lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')))
+            set_cookies += any('sessionid' in response.cookies for response in responses)
+        return {
+            'requests': requests,
+            'session_db_writes': writes,
+            'session_db_writes_per_request': round(writes / requests, 3),
+            'session_cookies_set': set_cookies,
+        }
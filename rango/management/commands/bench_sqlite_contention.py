@@ -0,0 +1,126 @@
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from django.test import override_settings
+
+from rango.benchmarks import Stopwatch, summarize, test_database
+from rango.models import Category, Page
+from rango.sqlite import current_pragmas
+
+CATEGORIES = 20
+PAGES_PER_CATEGORY = 10
+# with the stock backend: rollback journal, Python's 5s lock timeout
+STOCK_PRAGMAS = {'journal_mode': 'delete'}
+
+
+def like(rng):
+    Category.objects.filter(pk=rng.randint(1, CATEGORIES)).update(likes=F('likes') + 1)
+
+
+def flush_views(rng):
+    # a batch of page views, as written by the buffered counter
+    with transaction.atomic():
+        for pk in rng.sample(range(1, CATEGORIES * PAGES_PER_CATEGORY + 1), 5):
+            Page.objects.filter(pk=pk).update(views=F('views') + 1)
+
+
+def read_index(rng):
+    list(Category.objects.order_by('-likes', 'id')[:5])
+    list(Page.objects.order_by('-views', 'id')[:5])
+
+
+OPERATIONS = [(like, 0.4), (flush_views, 0.1), (read_index, 0.5)]
+
+
+def worker(db_path, pragmas, operations, seed, results):
+    # forked from the parent: never use its connection
+    connection.close()
+    connection.settings_dict['NAME'] = db_path
+    settings.RANGO_SQLITE_PRAGMAS = pragmas
+    rng = random.Random(seed)
+    functions, weights = zip(*OPERATIONS)
+    stopwatch = Stopwatch()
+    errors = 0
+    for i in range(operations):
+        operation = rng.choices(functions, weights)[0]
+        try:
+            with stopwatch:
+                operation(rng)
+        except OperationalError:
+            errors += 1
+    connection.close()
+    results.put((stopwatch.samples, errors))
+
+
+class Command(BaseCommand):
+    help = "Measure concurrent writes to SQLite from several processes, stock and tuned"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8)
+        parser.add_argument('--operations', type=int, default=300,
+                            help="operations per process, 50%% index reads, 40%% likes, 10%% view flushes")
+        parser.add_argument('--output', help="also write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("This benchmark is about the SQLite backend")
+        directory = tempfile.mkdtemp()
+        template = os.path.join(directory, 'template.sqlite3')
+        modes = [('stock', STOCK_PRAGMAS), ('tuned', settings.RANGO_SQLITE_PRAGMAS)]
+        report = {}
+        try:
+            with override_settings(RANGO_SQLITE_PRAGMAS=STOCK_PRAGMAS), test_database(name=template):
+                self.populate()
+                connection.close()
+                for mode, pragmas in modes:
+                    db_path = os.path.join(directory, mode + '.sqlite3')
+                    shutil.copy(template, db_path)
+                    report[mode] = self.bench(db_path, pragmas, options['processes'], options['operations'])
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def populate(self):
+        categories = Category.objects.bulk_create(
+            [Category(name='Category {}'.format(i), slug='category-{}'.format(i)) for i in range(CATEGORIES)])
+        Page.objects.bulk_create([
+            Page(category_id=i + 1, title='Page {}'.format(j), url='http://example.com/{}/{}'.format(i, j))
+            for i in range(len(categories)) for j in range(PAGES_PER_CATEGORY)])
+
+    def bench(self, db_path, pragmas, processes, operations):
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=worker, args=(db_path, pragmas, operations, seed, results))
+                   for seed in range(processes)]
+        start = time.perf_counter()
+        for process in workers:
+            process.start()
+        collected = [results.get() for process in workers]
+        elapsed = time.perf_counter() - start
+        for process in workers:
+            process.join()
+
+        samples = [sample for worker_samples, errors in collected for sample in worker_samples]
+        errors = sum(errors for worker_samples, errors in collected)
+        summary = summarize(samples, elapsed)
+        summary['errors'] = errors
+        summary['error_rate'] = round(errors / (processes * operations), 4)
+        with override_settings(RANGO_SQLITE_PRAGMAS=pragmas):
+            connection.settings_dict['NAME'], old_name = db_path, connection.settings_dict['NAME']
+            summary['pragmas'] = current_pragmas(connection, ['journal_mode', 'synchronous', 'busy_timeout'])
+            connection.close()
+            connection.settings_dict['NAME'] = old_name
+        return summary
@@ -0,0 +1,28 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from rango.exporters import FORMATS, iter_encoded, iter_lines
+
+
+class Command(BaseCommand):
+    help = ("Export all categories and pages with their views and likes as JSONL or CSV, "
+            "in constant memory")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+        parser.add_argument('--gzip', action='store_true', help="gzip the output")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="rows per query")
+        parser.add_argument('--output', help="output file, standard output by default")
+
+    def handle(self, *args, **options):
+        blocks = iter_encoded(iter_lines(options['format'], options['chunk_size']),
+                              compress=options['gzip'])
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                for block in blocks:
+                    f.write(block)
+        else:
+            for block in blocks:
+                sys.stdout.buffer.write(block)
+            sys.stdout.flush()
@@ -0,0 +1,111 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.defaultfilters import slugify
+
+from rango.models import Category, Page, UserProfile
+from rango.versions import CATEGORIES, CATEGORY, INDEX, bump_versions
+
+WORDS = ['python', 'django', 'web', 'data', 'async', 'testing', 'deploy', 'rest', 'api', 'orm',
+         'cache', 'queue', 'search', 'template', 'security', 'auth', 'admin', 'forms', 'static',
+         'media', 'sql', 'index', 'scaling', 'tutorial', 'tips', 'guide', 'news', 'tools']
+
+
+def zipf_weights(count, exponent=1.1):
+    return [1.0 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def popularity(rng, scale):
+    # heavy tailed: most rows get a handful, a few get a lot
+    return int(scale * (rng.paretovariate(1.2) - 1))
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic dataset of categories, pages and users with bulk inserts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=1000)
+        parser.add_argument('--pages', type=int, default=20000)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        start = time.perf_counter()
+        with transaction.atomic():
+            category_ids = self.create_categories(options['categories'])
+            self.create_pages(options['pages'], category_ids)
+            self.create_users(options['users'])
+        # bulk inserts send no signals
+        # the new categories come last, too many of them for an IN (...)
+        slugs = (Category.objects.filter(id__gte=category_ids[0]).values_list('slug', flat=True)
+                 if category_ids else [])
+        bump_versions(CATEGORIES, INDEX, *[CATEGORY.format(slug) for slug in slugs])
+        self.stdout.write("Generated {categories} categories, {pages} pages and {users} users "
+                          "in {elapsed:.2f}s".format(elapsed=time.perf_counter() - start, **options))
+
+    def bulk_create(self, model, objects):
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) == self.batch_size:
+                model.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+
+    def create_categories(self, count):
+        offset = Category.objects.count()
+
+        def categories():
+            for i in range(offset, offset + count):
+                name = '{} {} {}'.format(self.rng.choice(WORDS).title(), self.rng.choice(WORDS), i)
+                yield Category(name=name, slug=slugify(name),
+                               likes=popularity(self.rng, 5), views=popularity(self.rng, 50))
+
+        self.bulk_create(Category, categories())
+        # SQLite does not return the ids of bulk inserted rows
+        return list(Category.objects.order_by('id').values_list('id', flat=True)[offset:])
+
+    def create_pages(self, count, category_ids):
+        if not category_ids:
+            return
+        # a few categories hold most of the pages
+        weights = zipf_weights(len(category_ids))
+        self.rng.shuffle(weights)
+        assigned = self.rng.choices(category_ids, weights=weights, k=count)
+
+        def pages():
+            for i, category_id in enumerate(assigned):
+                words = self.rng.sample(WORDS, 3)
+                yield Page(category_id=category_id,
+                           title=' '.join(words).capitalize(),
+                           url='http://www.{}.com/{}/{}'.format(words[0], words[1], i),
+                           views=popularity(self.rng, 20))
+
+        self.bulk_create(Page, pages())
+
+    def create_users(self, count):
+        offset = User.objects.filter(username__startswith='rango_user_').count()
+        # hashing is slow on purpose, every generated user shares one password
+        password = make_password('rango-password')
+        usernames = ['rango_user_{}'.format(i) for i in range(offset, offset + count)]
+        self.bulk_create(User, (User(username=username, email='{}@example.com'.format(username),
+                                     password=password) for username in usernames))
+
+        def profiles():
+            for start in range(0, len(usernames), 500):
+                for user_id in User.objects.filter(
+                        username__in=usernames[start:start + 500]).values_list('id', flat=True):
+                    # about half of the users fill their profile in
+                    if self.rng.random() < 0.5:
+                        yield UserProfile(user_id=user_id,
+                                          website='http://{}.example.com/'.format(user_id))
+
+        self.bulk_create(UserProfile, profiles())
@@ -0,0 +1,183 @@
+import csv
+import io
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.template.defaultfilters import slugify
+
+from rango.constants import integer_default_views_and_likes
+from rango.models import Category, Page
+from rango.versions import CATEGORIES, CATEGORY, INDEX, bump_versions
+
+SLUG_MAX_LENGTH = Category._meta.get_field('slug').max_length
+
+
+class CategoryResolver(object):
+    """
+    Maps category names and slugs to ids in memory, creating the missing
+    categories of a batch with one bulk insert
+    """
+
+    def __init__(self):
+        self.by_name = {}
+        self.by_slug = {}
+        for pk, name, slug in Category.objects.values_list('id', 'name', 'slug').iterator():
+            self.by_name[name] = pk
+            self.by_slug[slug] = pk
+        self.created = 0
+        # ids of the categories created or given pages
+        self.changed = set()
+
+    def changed_slugs(self):
+        return [slug for slug, pk in self.by_slug.items() if pk in self.changed]
+
+    def lookup(self, value):
+        pk = self.by_name.get(value)
+        return pk if pk is not None else self.by_slug.get(value)
+
+    def unique_slug(self, name):
+        base = slugify(name)[:SLUG_MAX_LENGTH] or 'category'
+        slug, suffix = base, 1
+        while slug in self.by_slug:
+            suffix += 1
+            tail = '-{}'.format(suffix)
+            slug = base[:SLUG_MAX_LENGTH - len(tail)] + tail
+        return slug
+
+    def create_missing(self, records):
+        """
+        :param records: dicts with a 'category' key, records without a title
+            describe the category itself and may carry its likes and views
+        """
+        missing = {}
+        for record in records:
+            name = record['category']
+            if self.lookup(name) is None and name not in missing:
+                slug = self.unique_slug(name)
+                # reserve the slug for the next names of the batch
+                self.by_slug[slug] = None
+                category = Category(name=name, slug=slug)
+                if not record.get('title'):
+                    category.likes = int(record.get('likes') or integer_default_views_and_likes)
+                    category.views = int(record.get('views') or integer_default_views_and_likes)
+                missing[name] = category
+        if not missing:
+            return
+        Category.objects.bulk_create(missing.values())
+        slugs = [category.slug for category in missing.values()]
+        for pk, name, slug in Category.objects.filter(slug__in=slugs).values_list('id', 'name', 'slug'):
+            self.by_name[name] = pk
+            self.by_slug[slug] = pk
+            self.changed.add(pk)
+        self.created += len(missing)
+
+
+def read_jsonl(stream):
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if line:
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                raise CommandError("Line {}: {}".format(line_number, e))
+
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def clean_record(record):
+    """
+    Check a record and turn its counters into ints
+    :param record: dict read from the input
+    :return: the record
+    :raise ValueError: saying what is wrong with it
+    """
+    if not isinstance(record, dict):
+        raise ValueError("expected an object, got {!r}".format(record))
+    if not record.get('category'):
+        raise ValueError("no category")
+    if record.get('title') and not record.get('url'):
+        raise ValueError("page {!r} has no url".format(record['title']))
+    for field in ('likes', 'views'):
+        value = record.get(field)
+        if value is not None and value != '':
+            try:
+                record[field] = int(value)
+            except (TypeError, ValueError):
+                raise ValueError("{} is not a number: {!r}".format(field, value))
+    return record
+
+
+class Command(BaseCommand):
+    help = ("Stream categories and pages from a JSONL or CSV file into the database "
+            "with batched bulk inserts. Each record has a category (name or slug) and, "
+            "for pages, a title, a url and optionally views. Records without a title "
+            "create the category with optional likes and views")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="input file, - for standard input")
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            help="input format, guessed from the file extension by default")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        path = options['path']
+        input_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+        else:
+            stream = open(path, encoding='utf-8', newline='')
+
+        reader = read_csv if input_format == 'csv' else read_jsonl
+        resolver = CategoryResolver()
+        start = time.perf_counter()
+        rows = pages = 0
+        try:
+            with stream:
+                batch = []
+                for line_number, record in reader(stream):
+                    try:
+                        batch.append(clean_record(record))
+                    except ValueError as e:
+                        raise CommandError("Line {}: {}".format(line_number, e))
+                    rows += 1
+                    if len(batch) == options['batch_size']:
+                        pages += self.import_batch(batch, resolver)
+                        batch = []
+                        self.report(rows, start)
+                if batch:
+                    pages += self.import_batch(batch, resolver)
+        finally:
+            # bulk inserts send no signals; batches committed before an error are shown too
+            if resolver.created:
+                bump_versions(CATEGORIES)
+            if resolver.changed:
+                bump_versions(INDEX, *[CATEGORY.format(slug) for slug in resolver.changed_slugs()])
+        elapsed = time.perf_counter() - start
+        self.stdout.write("Imported {} rows ({} new categories, {} pages) in {:.2f}s, "
+                          "{:.0f} rows/s".format(rows, resolver.created, pages, elapsed,
+                                                 rows / elapsed if elapsed else 0))
+
+    def import_batch(self, batch, resolver):
+        with transaction.atomic():
+            resolver.create_missing(batch)
+            new_pages = [Page(category_id=resolver.lookup(record['category']),
+                              title=record['title'],
+                              url=record['url'],
+                              views=int(record.get('views') or integer_default_views_and_likes))
+                         for record in batch if record.get('title')]
+            Page.objects.bulk_create(new_pages)
+        resolver.changed.update(page.category_id for page in new_pages)
+        return len(new_pages)
+
+    def report(self, rows, start):
+        if self.verbosity > 1:
+            elapsed = time.perf_counter() - start
+            self.stdout.write("{} rows, {:.0f} rows/s".format(rows, rows / elapsed))
@@ -0,0 +1,45 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rango.models import UserProfile
+from rango.thumbnails import make_thumbnails, output_formats, thumbnail_sizes
+
+
+class Command(BaseCommand):
+    help = "Make the missing thumbnails of every profile picture"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'RANGO_THUMBNAIL_WORKERS', 2),
+                            help="Worker processes, 0 works in this process")
+        parser.add_argument('--force', action='store_true',
+                            help="Make thumbnails again even if they exist")
+
+    def handle(self, *args, **options):
+        names = list(UserProfile.objects.exclude(picture='').values_list('picture', flat=True))
+        arguments = (settings.MEDIA_ROOT, thumbnail_sizes(), output_formats(), options['force'])
+
+        start = time.perf_counter()
+        written = failed = 0
+        if options['workers'] > 0:
+            with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+                futures = [(name, pool.submit(make_thumbnails, name, *arguments)) for name in names]
+                for name, future in futures:
+                    try:
+                        written += len(future.result())
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write("{}: {}".format(name, e))
+        else:
+            for name in names:
+                try:
+                    written += len(make_thumbnails(name, *arguments))
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write("{}: {}".format(name, e))
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write("{} images, {} thumbnails written, {} failed in {:.2f}s ({:.1f} images/s)".format(
+            len(names), written, failed, elapsed, len(names) / elapsed if elapsed else 0))
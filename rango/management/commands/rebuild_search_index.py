@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from rango.fulltext import is_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the local full-text index of categories and pages"
+
+    def handle(self, *args, **options):
+        if not is_available():
+            raise CommandError("The full-text index needs the SQLite backend")
+        start = time.perf_counter()
+        with transaction.atomic():
+            count = rebuild_index()
+        self.stdout.write("Indexed {} rows in {:.2f}s".format(count, time.perf_counter() - start))
@@ -0,0 +1,71 @@
+import multiprocessing
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from rango.jobs import purge, requeue_stale, work
+
+
+def run_worker(poll_interval, once, stale_timeout):
+    # forked from the parent: never use its connection
+    connection.close()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(poll_interval=0 if once else poll_interval, stale_timeout=stale_timeout)
+
+
+class Command(BaseCommand):
+    help = "Run the rango job queue workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=getattr(settings, 'RANGO_JOB_WORKERS', 2),
+                            help="worker processes, 0 runs the jobs in this process")
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help="seconds between looks at an empty queue")
+        parser.add_argument('--once', action='store_true',
+                            help="stop once the queue is empty")
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help="seconds after which a running job is assumed lost and queued again")
+        parser.add_argument('--purge-days', type=int, default=7,
+                            help="delete finished jobs older than this")
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale(options['stale_after'])
+        purged = purge(options['purge_days'])
+        self.stdout.write("{} lost jobs queued again, {} old jobs purged".format(requeued, purged))
+
+        if options['processes'] <= 0:
+            count = work(poll_interval=0 if options['once'] else options['poll'],
+                         stale_timeout=options['stale_after'])
+            self.stdout.write("{} jobs run".format(count))
+            return
+
+        connection.close()
+        arguments = (options['poll'], options['once'], options['stale_after'])
+        workers = [self.start_worker(arguments) for i in range(options['processes'])]
+        try:
+            while workers:
+                time.sleep(1)
+                for process in list(workers):
+                    if process.is_alive():
+                        continue
+                    process.join()
+                    workers.remove(process)
+                    # a drained --once worker is done, a crashed one is replaced
+                    if process.exitcode != 0:
+                        self.stderr.write("Worker {} exited with {}, starting another".format(
+                            process.pid, process.exitcode))
+                        workers.append(self.start_worker(arguments))
+        except KeyboardInterrupt:
+            for process in workers:
+                process.terminate()
+            for process in workers:
+                process.join()
+
+    @staticmethod
+    def start_worker(arguments):
+        process = multiprocessing.Process(target=run_worker, args=arguments)
+        process.start()
+        return process
@@ -0,0 +1,71 @@
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rango.routers import PRIMARY
+
+
+def copy_database(source, target):
+    """
+    Write a consistent copy of an SQLite database next to target, then
+    swap it in, connections to the previous copy keep reading it
+    :param source: path of the database
+    :param target: path of the copy
+    """
+    tmp_target = target + '.tmp'
+    if os.path.exists(tmp_target):
+        os.remove(tmp_target)
+    connection = sqlite3.connect(source)
+    try:
+        if hasattr(connection, 'backup'):
+            destination = sqlite3.connect(tmp_target)
+            try:
+                connection.backup(destination)
+            finally:
+                destination.close()
+        else:
+            # Python < 3.7 has no backup API, SQLite 3.27+ can write a snapshot itself
+            connection.execute('VACUUM INTO ?', [tmp_target])
+    except sqlite3.OperationalError as e:
+        raise CommandError("Could not copy {}: {}".format(source, e))
+    finally:
+        connection.close()
+    # the copy is in the WAL mode of the primary, readers of the replica must not need a -wal file
+    copy = sqlite3.connect(tmp_target)
+    try:
+        copy.execute('PRAGMA journal_mode = delete')
+    finally:
+        copy.close()
+    os.replace(tmp_target, target)
+    # left by copies made in WAL mode, they belong to the replaced file
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(target + suffix):
+            os.remove(target + suffix)
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database over its replicas (RANGO_DATABASE_REPLICAS)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0,
+                            help="Keep copying every EVERY seconds, 0 copies once")
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[PRIMARY]
+        aliases = getattr(settings, 'RANGO_DATABASE_REPLICAS', [])
+        if not primary['ENGINE'].endswith('sqlite3'):
+            raise CommandError("Replicas of other databases are kept in sync by the database itself")
+        if not aliases:
+            raise CommandError("No replica in RANGO_DATABASE_REPLICAS")
+
+        while True:
+            for alias in aliases:
+                start = time.perf_counter()
+                copy_database(primary['NAME'], settings.DATABASES[alias]['NAME'])
+                self.stdout.write("{} synced in {:.3f}s".format(alias, time.perf_counter() - start))
+            if options['every'] <= 0:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,125 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404
+from django.utils._os import safe_join
+
+CHUNK_SIZE = 64 * 1024
+# names carrying a content hash, like ManifestStaticFilesStorage writes them
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{8,32}\.\w+$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+ONE_YEAR = 365 * 24 * 60 * 60
+
+
+def media_name(path):
+    """
+    The name of a media file below MEDIA_ROOT, what access is checked on
+    :param path: path below MEDIA_URL, may hold '.' and '..' segments
+    :return: the normalized path, '/' separated
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("No media file matches the given query.")
+    return os.path.relpath(full_path, os.path.abspath(settings.MEDIA_ROOT)).replace(os.sep, '/')
+
+
+def media_file(path):
+    """
+    Find a media file, refusing paths outside MEDIA_ROOT
+    :param path: path below MEDIA_URL
+    :return: (filesystem path, os.stat_result)
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404("No media file matches the given query.")
+    if not os.path.isfile(full_path):
+        raise Http404("No media file matches the given query.")
+    return full_path, stat
+
+
+def is_protected(path):
+    return any(path.startswith(prefix) for prefix in getattr(settings, 'RANGO_PROTECTED_MEDIA', []))
+
+
+def is_hashed(path):
+    return HASHED_NAME_RE.search(path) is not None
+
+
+def content_type(path):
+    content_type, encoding = mimetypes.guess_type(path)
+    return content_type or 'application/octet-stream'
+
+
+def file_etag(stat):
+    # strong enough for files replaced as a whole, as uploads and thumbnails are
+    return '"{:x}-{:x}"'.format(int(stat.st_mtime), stat.st_size)
+
+
+def parse_range(header, size):
+    """
+    Parse a single range Range header
+    :param header: e.g. 'bytes=0-499', 'bytes=500-' or 'bytes=-500'
+    :param size: file size
+    :return: (start, end) inclusive, None to send the whole file,
+    or ValueError when the range cannot be satisfied
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        # missing, malformed or several ranges: the whole file is a valid answer
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        suffix = int(last)
+        if suffix == 0:
+            raise ValueError(header)
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def iter_file(full_path, start, length, chunk_size=CHUNK_SIZE):
+    """
+    Read part of a file in chunks
+    :param full_path:
+    :param start: first byte
+    :param length: number of bytes
+    :param chunk_size:
+    :return: iterator of bytes
+    """
+    with open(full_path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def sendfile_headers(full_path):
+    """
+    Headers handing the transfer over to the front server
+    :param full_path:
+    :return: a dict, empty when RANGO_MEDIA_SENDFILE is not set
+    """
+    mode = getattr(settings, 'RANGO_MEDIA_SENDFILE', None)
+    if mode == 'x-sendfile':
+        # Apache mod_xsendfile, lighttpd
+        return {'X-Sendfile': full_path}
+    if mode == 'x-accel-redirect':
+        # nginx, RANGO_MEDIA_ACCEL_PREFIX must be an internal location aliased to MEDIA_ROOT
+        relative = os.path.relpath(full_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        return {'X-Accel-Redirect': getattr(settings, 'RANGO_MEDIA_ACCEL_PREFIX', '/protected-media/') + quote(relative)}
+    return {}
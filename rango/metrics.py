@@ -0,0 +1,433 @@
+import atexit
+import glob
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from functools import partial
+
+try:
+    import fcntl
+except ImportError:  # Windows, snapshots are then written without a lock
+    fcntl = None
+
+from django.conf import settings
+from django.db.backends.utils import CursorDebugWrapper, CursorWrapper
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger(__name__)
+
+# seconds
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# name: (type, help, histogram buckets)
+METRICS = OrderedDict([
+    ('rango_request_seconds', ('histogram', 'Wall time of the requests', TIME_BUCKETS)),
+    ('rango_sql_queries', ('histogram', 'SQL queries run by the requests', QUERY_BUCKETS)),
+    ('rango_sql_seconds', ('histogram', 'Time the requests spent in SQL queries', TIME_BUCKETS)),
+    ('rango_template_seconds', ('histogram', 'Time the requests spent rendering templates', TIME_BUCKETS)),
+    ('rango_search_seconds', ('histogram', 'Time the requests spent waiting on searches', TIME_BUCKETS)),
+    ('rango_responses_total', ('counter', 'Responses by status code', None)),
+])
+
+# snapshots of the workers which exited, added up
+EXITED_SNAPSHOT = 'exited.json'
+# snapshot intervals after which a snapshot is taken for the one of an exited worker
+STALE_SNAPSHOTS = 3
+
+_local = threading.local()
+
+
+class RequestTimings(object):
+    """
+    Where the time of the request served by this thread went
+    """
+
+    def __init__(self):
+        self.seconds = Counter()
+        self.counts = Counter()
+        self.rendering = False
+
+    def add(self, kind, seconds):
+        self.seconds[kind] += seconds
+        self.counts[kind] += 1
+
+
+def start_request():
+    _local.timings = RequestTimings()
+    return _local.timings
+
+
+def end_request():
+    _local.timings = None
+
+
+def current_timings():
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def timed(kind):
+    """
+    Add the time spent in the block to the request being served, if any
+    :param kind: 'sql', 'template', 'search'
+    """
+    timings = current_timings()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.add(kind, time.perf_counter() - start)
+
+
+class TimedCursorMixin(object):
+    def execute(self, sql, params=None):
+        with timed('sql'):
+            return super(TimedCursorMixin, self).execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        with timed('sql'):
+            return super(TimedCursorMixin, self).executemany(sql, param_list)
+
+
+class TimedCursorWrapper(TimedCursorMixin, CursorWrapper):
+    pass
+
+
+class TimedCursorDebugWrapper(TimedCursorMixin, CursorDebugWrapper):
+    pass
+
+
+def instrument_connection(connection):
+    """
+    Time the queries of a database connection, the debug cursor
+    used by DEBUG and assertNumQueries included
+    :param connection: a Django database connection
+    """
+    connection.make_cursor = partial(TimedCursorWrapper, db=connection)
+    connection.make_debug_cursor = partial(TimedCursorDebugWrapper, db=connection)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = current_timings()
+        # includes and inclusion tags are part of the outermost template
+        if timings is None or timings.rendering:
+            return super(TimedTemplate, self).render(context, request)
+        timings.rendering = True
+        start = time.perf_counter()
+        try:
+            return super(TimedTemplate, self).render(context, request)
+        finally:
+            timings.rendering = False
+            timings.add('template', time.perf_counter() - start)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing renders
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+@contextmanager
+def directory_lock(directory):
+    # between the processes writing and folding snapshots
+    with open(os.path.join(directory, '.lock'), 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def read_series(path):
+    """
+    :param path: a snapshot
+    :return: {(name, labels): values}, empty if it cannot be read
+    """
+    try:
+        with open(path) as snapshot:
+            return {(name, tuple(tuple(label) for label in labels)): values
+                    for name, labels, values in json.load(snapshot)}
+    except (OSError, ValueError):
+        return {}
+
+
+def write_series(path, series):
+    with open(path + '.tmp', 'w') as snapshot:
+        json.dump([[name, labels, values] for (name, labels), values in series.items()], snapshot)
+    os.replace(path + '.tmp', path)
+
+
+def add_series(total, series):
+    for key, values in series.items():
+        current = total.setdefault(key, [0] * len(values))
+        # a snapshot of a worker running other buckets
+        if len(current) == len(values):
+            total[key] = [a + b for a, b in zip(current, values)]
+
+
+def fold_snapshot(path, exited_path):
+    """
+    Move a snapshot into the exited totals
+    """
+    exited = read_series(exited_path)
+    add_series(exited, read_series(path))
+    write_series(exited_path, exited)
+    os.remove(path)
+
+
+class MetricsRegistry(object):
+    """
+    Histograms and counters of this process, written every
+    RANGO_METRICS_SNAPSHOT_INTERVAL seconds to RANGO_METRICS_DIR where
+    the /metrics endpoint adds up the snapshots of every worker. Those of
+    exited workers are folded into one file, so totals never go down.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._pid = os.getpid()
+        self._written_at = 0
+        self._cleanup_pid = None
+        # series of the last snapshot written
+        self._written = None
+
+    def _check_pid(self):
+        # a forked worker starts from nothing, its parent reports what came before
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._series = {}
+            self._written_at = 0
+            self._written = None
+
+    def _values(self, name, labels):
+        self._check_pid()
+        key = (name, tuple(sorted(labels.items())))
+        values = self._series.get(key)
+        if values is None:
+            kind, help_text, buckets = METRICS[name]
+            # a count per bucket, +Inf included, then the sum
+            values = self._series[key] = [0] * (len(buckets) + 2) if buckets else [0]
+        return values
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        with self._lock:
+            values = self._values(name, labels)
+            values[bisect_left(buckets, value)] += 1
+            values[-1] += value
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self._values(name, labels)[0] += amount
+
+    def series(self):
+        with self._lock:
+            self._check_pid()
+            return {key: list(values) for key, values in self._series.items()}
+
+    def clear(self):
+        with self._lock:
+            self._series = {}
+            self._written = None
+
+    def snapshot_path(self):
+        directory = getattr(settings, 'RANGO_METRICS_DIR', None)
+        if not directory:
+            return None
+        return os.path.join(directory, 'rango-{}.json'.format(os.getpid()))
+
+    def write_snapshot(self, force=False):
+        """
+        Save the series of this process for the other workers
+        :param force: even if the last snapshot is recent
+        """
+        path = self.snapshot_path()
+        now = time.monotonic()
+        if path is None or (not force and now - self._written_at < getattr(
+                settings, 'RANGO_METRICS_SNAPSHOT_INTERVAL', 5)):
+            return
+        self._written_at = now
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with directory_lock(os.path.dirname(path)):
+                self._write(path)
+        except OSError:
+            logger.exception("Could not write the metrics snapshot %s", path)
+            return
+        if self._cleanup_pid != os.getpid():
+            self._cleanup_pid = os.getpid()
+            atexit.register(self.retire, path, os.getpid())
+
+    def _write(self, path):
+        # collect() folded our last snapshot into the exited totals, they already count it
+        if self._written is not None and not os.path.exists(path):
+            with self._lock:
+                for key, written in self._written.items():
+                    values = self._series.get(key)
+                    if values is not None and len(values) == len(written):
+                        self._series[key] = [a - b for a, b in zip(values, written)]
+        series = self.series()
+        write_series(path, series)
+        self._written = series
+
+    def retire(self, path, pid):
+        """
+        Add the series of this process to the exited totals, at exit: the
+        merged counters must not go down when a worker stops
+        :param path: the snapshot of this process
+        :param pid: the process which registered this, forked children inherit it
+        """
+        directory = os.path.dirname(path)
+        if pid != os.getpid() or not os.path.isdir(directory):
+            return
+        try:
+            with directory_lock(directory):
+                self._write(path)
+                fold_snapshot(path, os.path.join(directory, EXITED_SNAPSHOT))
+                self._written = None
+                self.clear()
+        except OSError:
+            logger.exception("Could not retire the metrics snapshot %s", path)
+
+    def collect(self):
+        """
+        :return: the series of every worker, added up, those which exited included
+        """
+        path = self.snapshot_path()
+        if path is None:
+            return self.series()
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # killed workers could not retire, nor can idle ones write: their snapshots are
+        # folded into the exited totals, idle workers take them off when writing again
+        stale_before = time.time() - STALE_SNAPSHOTS * getattr(settings, 'RANGO_METRICS_SNAPSHOT_INTERVAL', 5)
+        with directory_lock(directory):
+            self._write(path)
+            self._written_at = time.monotonic()
+            exited = os.path.join(directory, EXITED_SNAPSHOT)
+            snapshots = []
+            for snapshot_path in glob.glob(os.path.join(directory, 'rango-[0-9]*.json')):
+                try:
+                    stale = snapshot_path != path and os.path.getmtime(snapshot_path) < stale_before
+                except OSError:
+                    continue
+                if stale:
+                    fold_snapshot(snapshot_path, exited)
+                else:
+                    snapshots.append(snapshot_path)
+            merged = read_series(exited)
+            for snapshot_path in snapshots:
+                add_series(merged, read_series(snapshot_path))
+        return merged
+
+
+metrics = MetricsRegistry()
+
+
+def allowed_to_scrape(request):
+    """
+    :param request:
+    :return: whether the request may read /metrics: staff, RANGO_METRICS_ALLOWED_IPS
+        or the RANGO_METRICS_TOKEN bearer token
+    """
+    if request.user.is_staff:
+        return True
+    if request.META.get('REMOTE_ADDR') in getattr(settings, 'RANGO_METRICS_ALLOWED_IPS', []):
+        return True
+    token = getattr(settings, 'RANGO_METRICS_TOKEN', None)
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(authorization, 'Bearer {}'.format(token))
+
+
+def record_request(view, status, seconds, timings):
+    """
+    Add a finished request to the metrics of its view
+    :param view: URL name
+    :param status: HTTP status code
+    :param seconds: wall time
+    :param timings: its RequestTimings
+    """
+    labels = {'view': view}
+    metrics.observe('rango_request_seconds', labels, seconds)
+    metrics.observe('rango_sql_queries', labels, timings.counts['sql'])
+    metrics.observe('rango_sql_seconds', labels, timings.seconds['sql'])
+    metrics.observe('rango_template_seconds', labels, timings.seconds['template'])
+    if timings.counts['search']:
+        metrics.observe('rango_search_seconds', labels, timings.seconds['search'])
+    metrics.inc('rango_responses_total', {'view': view, 'status': str(status)})
+    metrics.write_snapshot()
+
+
+def record_search(view, seconds):
+    """
+    Add a search awaited outside of the request, by rango.asgi
+    :param view: URL name of the view which deferred it
+    :param seconds:
+    """
+    metrics.observe('rango_search_seconds', {'view': view}, seconds)
+
+
+def server_timing(seconds, timings):
+    """
+    :param seconds: wall time of the request
+    :param timings: its RequestTimings
+    :return: a Server-Timing header value, durations in milliseconds
+    """
+    entries = ['total;dur={:.1f}'.format(seconds * 1000),
+               'db;dur={:.1f};desc="{} queries"'.format(timings.seconds['sql'] * 1000, timings.counts['sql']),
+               'tpl;dur={:.1f}'.format(timings.seconds['template'] * 1000)]
+    if timings.counts['search']:
+        entries.append('search;dur={:.1f}'.format(timings.seconds['search'] * 1000))
+    return ', '.join(entries)
+
+
+def _label_value(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels):
+    return '{' + ','.join('{}="{}"'.format(name, _label_value(value)) for name, value in labels) + '}'
+
+
+def render_prometheus(series):
+    """
+    :param series: {(name, labels): values} as collected
+    :return: the Prometheus text exposition format
+    """
+    by_name = {}
+    for (name, labels), values in series.items():
+        by_name.setdefault(name, []).append((labels, values))
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        for labels, values in sorted(by_name.get(name, [])):
+            if kind == 'counter':
+                lines.append('{}{} {}'.format(name, _labels(labels), values[0]))
+                continue
+            count = 0
+            for le, bucket_count in zip([repr(float(le)) for le in buckets] + ['+Inf'], values[:-1]):
+                count += bucket_count
+                lines.append('{}_bucket{} {}'.format(name, _labels(labels + (('le', le),)), count))
+            lines.append('{}_sum{} {!r}'.format(name, _labels(labels), float(values[-1])))
+            lines.append('{}_count{} {}'.format(name, _labels(labels), count))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,67 @@
+import time
+
+from django.conf import settings
+
+from rango.deferred import DeferredSearch
+from rango.metrics import end_request, record_request, server_timing, start_request
+from rango.routers import has_written, pin_to_primary, replicas, unpin
+
+PIN_COOKIE = 'rango_primary'
+
+
+class ReadYourWritesMiddleware(object):
+    """
+    Clients which just wrote read from the primary database for
+    RANGO_REPLICA_LAG seconds, until the replicas caught up
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        unpin()
+        lag = getattr(settings, 'RANGO_REPLICA_LAG', 5)
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        if pinned_until > time.time():
+            pin_to_primary()
+
+        try:
+            response = self.get_response(request)
+            if has_written() and replicas():
+                response.set_cookie(PIN_COOKIE, '{:.3f}'.format(time.time() + lag), max_age=lag, httponly=True)
+        finally:
+            # the thread may serve another client next
+            unpin()
+        return response
+
+
+class MetricsMiddleware(object):
+    """
+    Times every request per URL name: wall time, SQL queries, template
+    rendering and searches, added to the rango.metrics histograms and
+    sent in a Server-Timing header
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request()
+        seconds = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        record_request(view, response.status_code, seconds, timings)
+        if isinstance(response, DeferredSearch):
+            response.view_name = view
+        if getattr(settings, 'RANGO_SERVER_TIMING', True):
+            response['Server-Timing'] = server_timing(seconds, timings)
+        return response
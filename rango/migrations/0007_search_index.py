@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Full-text index over category names and page titles/urls, SQLite only.
+# Rowids are derived from primary keys (categories even, pages odd) so the
+# triggers below update single rows without scanning the index.
+CREATE_SQL = [
+    """CREATE VIRTUAL TABLE rango_search_index USING fts5(
+           title, url, slug UNINDEXED, prefix='2 3', tokenize='unicode61')""",
+    """CREATE TRIGGER rango_category_search_insert AFTER INSERT ON rango_category BEGIN
+           INSERT INTO rango_search_index(rowid, title, url, slug)
+           VALUES (new.id * 2, new.name, '', new.slug);
+       END""",
+    """CREATE TRIGGER rango_category_search_update AFTER UPDATE OF name, slug ON rango_category BEGIN
+           UPDATE rango_search_index SET title = new.name, slug = new.slug WHERE rowid = new.id * 2;
+       END""",
+    """CREATE TRIGGER rango_category_search_delete AFTER DELETE ON rango_category BEGIN
+           DELETE FROM rango_search_index WHERE rowid = old.id * 2;
+       END""",
+    """CREATE TRIGGER rango_page_search_insert AFTER INSERT ON rango_page BEGIN
+           INSERT INTO rango_search_index(rowid, title, url, slug)
+           VALUES (new.id * 2 + 1, new.title, new.url, '');
+       END""",
+    """CREATE TRIGGER rango_page_search_update AFTER UPDATE OF title, url ON rango_page BEGIN
+           UPDATE rango_search_index SET title = new.title, url = new.url WHERE rowid = new.id * 2 + 1;
+       END""",
+    """CREATE TRIGGER rango_page_search_delete AFTER DELETE ON rango_page BEGIN
+           DELETE FROM rango_search_index WHERE rowid = old.id * 2 + 1;
+       END""",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS rango_category_search_insert",
+    "DROP TRIGGER IF EXISTS rango_category_search_update",
+    "DROP TRIGGER IF EXISTS rango_category_search_delete",
+    "DROP TRIGGER IF EXISTS rango_page_search_insert",
+    "DROP TRIGGER IF EXISTS rango_page_search_update",
+    "DROP TRIGGER IF EXISTS rango_page_search_delete",
+    "DROP TABLE IF EXISTS rango_search_index",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+    schema_editor.execute(
+        "INSERT INTO rango_search_index(rowid, title, url, slug) "
+        "SELECT id * 2, name, '', slug FROM rango_category")
+    schema_editor.execute(
+        "INSERT INTO rango_search_index(rowid, title, url, slug) "
+        "SELECT id * 2 + 1, title, url, '' FROM rango_page")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0006_auto_20171007_1256'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
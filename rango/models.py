@@ -47,6 +47,10 @@ class Category(models.Model):
 
     class Meta:
         verbose_name_plural = "Categories"
+        indexes = [
+            # most liked categories
+            models.Index(fields=['-likes', 'id'], name='rango_cat_likes_idx'),
+        ]
 
     def pages_count(self):
         return self.page_set.count()
@@ -62,3 +66,49 @@ class Page(models.Model):
 
     def __str__(self):
         return self.title
+
+    class Meta:
+        indexes = [
+            # pages of a category, most viewed first
+            models.Index(fields=['category', '-views'], name='rango_page_cat_views_idx'),
+            # most viewed pages
+            models.Index(fields=['-views', 'id'], name='rango_page_views_idx'),
+        ]
+
+
+def new_job_key():
+    return uuid.uuid4().hex
+
+
+class Job(models.Model):
+    # work done by the run_job_workers processes, see rango.jobs
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    # unguessable, the status endpoint is keyed on it
+    key = models.CharField(max_length=32, unique=True, default=new_job_key)
+    name = models.CharField(max_length=100)
+    payload = models.TextField(default='{}')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # not run before, pushed back after a failed attempt
+    run_at = models.DateTimeField()
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+
+    def __str__(self):
+        return '{} {}'.format(self.name, self.key)
+
+    class Meta:
+        indexes = [
+            # next jobs to run
+            models.Index(fields=['status', 'run_at'], name='rango_job_next_idx'),
+        ]
@@ -0,0 +1,72 @@
+import hashlib
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+PAGE_KEY = 'rango:page:{}'
+
+
+class PageCacheStats(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+page_cache_stats = PageCacheStats()
+
+
+def cache_page_shell(key_func):
+    """
+    Keep pages in the cache, under their url and
+    key_func(request, *args, **kwargs), usually the page ETag: writes move
+    the content versions it is made of forward, so only the pages showing
+    what changed are rendered again.
+    Only for pages which are the same for every user, their personal parts
+    being loaded as fragments.
+    :param key_func: same arguments as the view, returns a string
+    :return: a view decorator
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            variant = '{}:{}'.format(request.get_full_path(), key_func(request, *args, **kwargs))
+            key = PAGE_KEY.format(hashlib.md5(variant.encode()).hexdigest())
+            cached = cache.get(key)
+            page_cache_stats.count(cached is not None)
+            if cached is not None:
+                status, content, headers = cached
+                response = HttpResponse(content, status=status)
+                for header, value in headers:
+                    response[header] = value
+                return response
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                cache.set(key, (response.status_code, response.content, list(response.items())),
+                          getattr(settings, 'RANGO_PAGE_CACHE_TIMEOUT', 600))
+            return response
+        return wrapper
+    return decorator
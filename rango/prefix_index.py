@@ -0,0 +1,65 @@
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+
+from .models import Category
+from .routers import PRIMARY
+from .versions import CATEGORIES, get_version
+
+CategoryEntry = namedtuple('CategoryEntry', ['name', 'slug'])
+
+
+class PrefixIndex(object):
+    """
+    Case-folded, sorted in memory copy of the category names answering
+    prefix lookups with a binary search. It is loaded lazily and dropped
+    by invalidate() whenever a category is saved or deleted, or when
+    version_func reports a change made by another worker.
+    """
+
+    def __init__(self, loader, version_func=None):
+        self._loader = loader
+        self._version_func = version_func
+        self._lock = threading.Lock()
+        # (version, sorted case-folded names, entries in the same order)
+        self._data = None
+
+    def invalidate(self):
+        self._data = None
+
+    def _snapshot(self):
+        version = self._version_func() if self._version_func else None
+        data = self._data
+        if data is None or data[0] != version:
+            with self._lock:
+                if self._data is None or self._data[0] != version:
+                    pairs = sorted((entry.name.casefold(), entry) for entry in self._loader())
+                    self._data = (version, [key for key, _ in pairs], [entry for _, entry in pairs])
+                data = self._data
+        return data[1], data[2]
+
+    def search(self, prefix='', limit=0):
+        """
+        :param prefix: case-insensitive start of the name
+        :param limit: maximum number of entries, 0 for all of them
+        :return: matching entries in name order
+        """
+        keys, entries = self._snapshot()
+        prefix = prefix.casefold()
+        start = bisect_left(keys, prefix)
+        stop = start
+        end = len(keys) if limit <= 0 else min(len(keys), start + limit)
+        while stop < end and keys[stop].startswith(prefix):
+            stop += 1
+        return entries[start:stop]
+
+    def __len__(self):
+        return len(self._snapshot()[0])
+
+
+def load_categories():
+    # kept until CATEGORIES moves, which may be before the replicas have the change
+    return [CategoryEntry(*row) for row in Category.objects.using(PRIMARY).values_list('name', 'slug').iterator()]
+
+
+category_index = PrefixIndex(load_categories, lambda: get_version(CATEGORIES))
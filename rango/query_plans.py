@@ -0,0 +1,32 @@
+from django.db import connections
+
+# plan details SQLite reports for work proportional to the table size
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+def explain(queryset):
+    """
+    EXPLAIN QUERY PLAN of a queryset, SQLite only
+    :param queryset:
+    :return: list of plan detail strings
+    """
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(plan):
+    """
+    :param plan: list of plan details from explain()
+    :return: the details showing a full table scan or a sort in a temporary b-tree
+    """
+    problems = []
+    for detail in plan:
+        # 'SCAN rango_page' (or 'SCAN TABLE rango_page' before SQLite 3.36)
+        # reads every row unless it walks an index
+        full_scan = detail.startswith('SCAN') and 'INDEX' not in detail
+        if full_scan or TEMP_SORT in detail:
+            problems.append(detail)
+    return problems
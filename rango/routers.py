@@ -0,0 +1,90 @@
+import os
+import random
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+
+_state = threading.local()
+
+
+def replicas():
+    """
+    Replica aliases which can be read from: declared in DATABASES and,
+    for SQLite, whose file has been made by sync_replicas
+    :return: a list of aliases
+    """
+    available = []
+    for alias in getattr(settings, 'RANGO_DATABASE_REPLICAS', []):
+        database = settings.DATABASES.get(alias)
+        if database is None:
+            continue
+        if database['ENGINE'].endswith('sqlite3') and not os.path.exists(database['NAME']):
+            continue
+        available.append(alias)
+    return available
+
+
+def pin_to_primary():
+    # reads of this thread go to the primary until unpin()
+    _state.pinned = True
+
+
+def unpin():
+    _state.pinned = False
+    _state.written = False
+
+
+def has_written():
+    return getattr(_state, 'written', False)
+
+
+def read_from_primary(view):
+    """
+    Views whose pages are cached under the content versions: these are
+    bumped as soon as the primary is written, a replica lagging behind
+    would have the old rows cached under the new version
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        pinned = getattr(_state, 'pinned', False)
+        pin_to_primary()
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _state.pinned = pinned or has_written()
+    return wrapper
+
+
+class PrimaryReplicaRouter(object):
+    """
+    Writes go to the primary, reads to a random replica from
+    RANGO_DATABASE_REPLICAS, or to the primary when there is none.
+
+    Once a thread wrote, its reads go to the primary as well, the
+    replicas may not have the write yet. ReadYourWritesMiddleware keeps
+    this for the next requests of the same client.
+    """
+
+    def db_for_read(self, model, **hints):
+        # a transaction of the primary must see its own writes
+        if getattr(_state, 'pinned', False) or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        available = replicas()
+        return random.choice(available) if available else PRIMARY
+
+    def db_for_write(self, model, **hints):
+        _state.written = True
+        _state.pinned = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copies of the migrated primary
+        return db not in getattr(settings, 'RANGO_DATABASE_REPLICAS', [])
@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from rango.webhose_search import run_query
+
+logger = logging.getLogger(__name__)
+
+
+class _Call(object):
+    """
+    An upstream request other threads asking for the same key wait on
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class QueryCache(object):
+    """
+    In process LRU cache with a time to live.
+
+    Entries older than ``ttl`` but younger than ``ttl + stale_ttl`` are still
+    served while a single background refresh runs (stale-while-revalidate).
+    Concurrent misses on the same key share one call to ``compute``.
+    """
+
+    def __init__(self, max_size=256, ttl=300, stale_ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key, compute):
+        """
+        Return the cached value for key, calling compute() on a miss
+        :param key: a hashable cache key
+        :param compute: function without arguments producing the value
+        :return: the value
+        """
+        now = time.monotonic()
+        refresh = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                age = now - stored_at
+                if age < self.ttl:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return value
+                if age < self.ttl + self.stale_ttl:
+                    self.stale_hits += 1
+                    self._entries.move_to_end(key)
+                    if key not in self._in_flight:
+                        refresh = self._in_flight[key] = _Call()
+                else:
+                    del self._entries[key]
+                    entry = None
+
+            if entry is None:
+                call = self._in_flight.get(key)
+                leader = call is None
+                if leader:
+                    self.misses += 1
+                    call = self._in_flight[key] = _Call()
+                else:
+                    self.coalesced += 1
+
+        if entry is not None:
+            if refresh is not None:
+                threading.Thread(target=self._refresh, args=(key, compute, refresh),
+                                 name='rango-query-cache-refresh', daemon=True).start()
+            return value
+
+        if leader:
+            return self._fill(key, compute, call)
+        return call.wait()
+
+    def peek(self, key, count_miss=True):
+        """
+        The fresh cached value for key, without computing anything
+        :param key:
+        :param count_miss: False when a get() for the same key follows a miss
+        :return: the value or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[0]
+            if count_miss:
+                self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def _fill(self, key, compute, call):
+        try:
+            call.value = compute()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                # empty results usually mean the upstream failed, do not keep them
+                if call.error is None and call.value:
+                    self._store(key, call.value)
+            call.done.set()
+        return call.value
+
+    def _refresh(self, key, compute, call):
+        try:
+            self._fill(key, compute, call)
+        except Exception:
+            logger.exception("Background refresh of %r failed, keeping the stale value", key)
+
+    def _store(self, key, value):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'hit_ratio': (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            }
+
+
+search_cache = QueryCache(max_size=getattr(settings, 'RANGO_SEARCH_CACHE_SIZE', 256),
+                          ttl=getattr(settings, 'RANGO_SEARCH_CACHE_TTL', 300),
+                          stale_ttl=getattr(settings, 'RANGO_SEARCH_CACHE_STALE_TTL', 3600))
+
+
+def normalize_query(search_terms):
+    return ' '.join(search_terms.lower().split())
+
+
+def cached_run_query(search_terms, size=10):
+    """
+    run_query through the shared result cache, keyed on the normalized
+    search terms and size
+    :param search_terms:
+    :param size:
+    :return: a list of results
+    """
+    query = normalize_query(search_terms)
+    return search_cache.get((query, size), lambda: run_query(query, size))
@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .leaderboards import index_bumped, top_categories, top_pages
+from .metrics import instrument_connection
+from .models import Category, Page, UserProfile
+from .prefix_index import category_index
+from .sqlite import apply_pragmas
+from .thumbnails import schedule_thumbnails
+from .tracking import forget_page_url, page_views
+from .versions import CATEGORIES, CATEGORY, INDEX, bump_versions
+
+
+def category_slug(page):
+    # pages deleted along with their category cannot load it any more
+    if Page.category.is_cached(page):
+        return page.category.slug
+    return Category.objects.filter(pk=page.category_id).values_list('slug', flat=True).first()
+
+
+def bump_page_versions(page):
+    slug = category_slug(page)
+    return bump_versions(INDEX, *([CATEGORY.format(slug)] if slug is not None else []))
+
+
+@receiver(post_save, sender=Page)
+def page_saved(sender, instance, **kwargs):
+    # the url may have changed, the redirect cache must not keep the old one
+    forget_page_url(instance.pk)
+    top_pages.offer_instance(instance)
+    index_bumped(bump_page_versions(instance)[INDEX])
+
+
+@receiver(post_delete, sender=Page)
+def page_deleted(sender, instance, **kwargs):
+    forget_page_url(instance.pk)
+    top_pages.discard(instance.pk)
+    index_bumped(bump_page_versions(instance)[INDEX])
+
+
+@receiver(pre_save, sender=Category)
+def category_saving(sender, instance, **kwargs):
+    # a rename changes the slug, pages cached under the old one must go too
+    instance._previous_slug = None
+    if instance.pk is not None:
+        instance._previous_slug = Category.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    slugs = {instance.slug, getattr(instance, '_previous_slug', None)} - {None}
+    category_index.invalidate()
+    top_categories.offer_instance(instance)
+    index_bumped(bump_versions(CATEGORIES, INDEX, *[CATEGORY.format(slug) for slug in slugs])[INDEX])
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    bump_versions(CATEGORIES, INDEX, CATEGORY.format(instance.slug))
+    category_index.invalidate()
+    top_categories.discard(instance.pk)
+    # its pages went with it
+    top_pages.invalidate()
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_saved(sender, instance, **kwargs):
+    if instance.picture:
+        name = instance.picture.name
+        # the upload is only final once the transaction commits
+        transaction.on_commit(lambda: schedule_thumbnails(name))
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    apply_pragmas(connection)
+    instrument_connection(connection)
+
+
+def page_views_flushed(increments):
+    top_pages.offer_ids(increments)
+    slugs = set()
+    pks = list(increments)
+    for start in range(0, len(pks), 500):
+        slugs.update(Page.objects.filter(pk__in=pks[start:start + 500])
+                     .values_list('category__slug', flat=True).distinct())
+    index_bumped(bump_versions(INDEX, *[CATEGORY.format(slug) for slug in slugs])[INDEX])
+
+
+page_views.listeners.append(page_views_flushed)
@@ -0,0 +1,33 @@
+from django.conf import settings
+
+
+def apply_pragmas(connection, pragmas=None):
+    """
+    Configure a new SQLite connection for concurrent workers
+    :param connection: a Django database connection, other vendors are left alone
+    :param pragmas: {name: value}, RANGO_SQLITE_PRAGMAS by default
+    """
+    if connection.vendor != 'sqlite':
+        return
+    if pragmas is None:
+        pragmas = getattr(settings, 'RANGO_SQLITE_PRAGMAS', {})
+    if connection.alias in getattr(settings, 'RANGO_DATABASE_REPLICAS', []):
+        # read only copies swapped by sync_replicas: no -wal/-shm files to leave behind
+        pragmas = dict(pragmas, journal_mode='delete')
+    # on the raw connection, this runs while Django is still opening it
+    for name, value in pragmas.items():
+        connection.connection.execute('PRAGMA {} = {}'.format(name, value))
+
+
+def current_pragmas(connection, names):
+    """
+    :param connection: an SQLite Django database connection
+    :param names: pragma names
+    :return: {name: current value}
+    """
+    with connection.cursor() as cursor:
+        values = {}
+        for name in names:
+            cursor.execute('PRAGMA {}'.format(name))
+            values[name] = cursor.fetchone()[0]
+        return values
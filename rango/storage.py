@@ -0,0 +1,101 @@
+import gzip
+import io
+import logging
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# bundle name: its parts, concatenated in this order
+BUNDLES = {
+    'js/rango.bundle.js': ['js/rango_jquery.js', 'js/rango_ajax.js'],
+}
+COMPRESSED_EXTENSIONS = ('.js', '.css', '.svg', '.json', '.txt', '.eot', '.ttf', '.otf', '.ico')
+# not worth a second file if it saves less than that
+MIN_SAVING = 0.05
+
+
+def gzip_bytes(data):
+    out = io.BytesIO()
+    # mtime=0 keeps the output identical between runs
+    with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(data)
+    return out.getvalue()
+
+
+class RangoStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Content hashed names through the manifest, plus at collectstatic:
+    the BUNDLES are written and hashed like any other file, and every
+    text asset gets precompressed .gz (and .br with the brotli package)
+    siblings for the front server to send as they are.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        for name, parts in BUNDLES.items():
+            self._write(name, self._bundle(paths, parts))
+            paths[name] = (self, name)
+            yield name, name, True
+
+        for processed in super(RangoStaticFilesStorage, self).post_process(paths, dry_run, **options):
+            yield processed
+
+        for hashed_name in sorted(set(self.hashed_files.values())):
+            if hashed_name.endswith(COMPRESSED_EXTENSIONS):
+                for compressed_name in self._compress(hashed_name):
+                    yield hashed_name, compressed_name, True
+
+    def _bundle(self, paths, parts):
+        contents = []
+        for part in parts:
+            storage, path = paths[part]
+            with storage.open(path) as f:
+                # a part without its final semicolon must not run into the next one
+                contents.append(f.read().rstrip() + b'\n;\n')
+        return b''.join(contents)
+
+    def _compress(self, name):
+        with self.open(name) as f:
+            data = f.read()
+        encodings = [('.gz', gzip_bytes)]
+        if brotli is not None:
+            encodings.append(('.br', lambda data: brotli.compress(data, quality=11)))
+        for extension, compress in encodings:
+            compressed = compress(data)
+            if len(compressed) <= len(data) * (1 - MIN_SAVING):
+                self._write(name + extension, compressed)
+                yield name + extension
+
+    def _write(self, name, content):
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(content))
+
+    def url_converter(self, name, hashed_files, template=None):
+        converter = super(RangoStaticFilesStorage, self).url_converter(name, hashed_files, template)
+
+        def lenient_converter(matchobj):
+            # the bootstrap css refers to glyphicons fonts we do not ship
+            try:
+                return converter(matchobj)
+            except ValueError as e:
+                logger.warning("Leaving a reference of %s as it is: %s", name, e)
+                return matchobj.group(0)
+        return lenient_converter
+
+    def stored_name(self, name):
+        # files added since the last collectstatic, or tests run without one,
+        # are served under their plain name rather than breaking the page
+        try:
+            return super(RangoStaticFilesStorage, self).stored_name(name)
+        except ValueError:
+            logger.debug("%s is not in the staticfiles manifest, run collectstatic", name)
+            return name
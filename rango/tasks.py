@@ -0,0 +1,16 @@
+from django.conf import settings
+
+from .jobs import task
+from .thumbnails import make_thumbnails, output_formats, thumbnail_sizes
+
+
+@task('search')
+def search(query):
+    # imported here, views depend on the jobs
+    from .views import run_search
+    return run_search(query)
+
+
+@task('thumbnails')
+def thumbnails(name, force=False):
+    return make_thumbnails(name, settings.MEDIA_ROOT, thumbnail_sizes(), output_formats(), force)
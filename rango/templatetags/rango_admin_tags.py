@@ -0,0 +1,23 @@
+from django import template
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR
+
+register = template.Library()
+
+KEYSET_VAR = 'id__lt'
+
+
+@register.simple_tag
+def keyset_links(cl):
+    """
+    Links walking a changelist ordered by descending id without offsets
+    :param cl: the admin ChangeList
+    :return: {'first': url or None, 'older': url or None}
+    """
+    links = {'first': None, 'older': None}
+    if KEYSET_VAR in cl.params:
+        links['first'] = cl.get_query_string(remove=[KEYSET_VAR, PAGE_VAR])
+    results = list(cl.result_list)
+    # only meaningful in the default descending id order
+    if ORDER_VAR not in cl.params and results and len(results) == cl.list_per_page:
+        links['older'] = cl.get_query_string({KEYSET_VAR: results[-1].pk}, [PAGE_VAR])
+    return links
@@ -1,10 +1,54 @@
 from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
 from rango.models import Category
+from rango.storage import BUNDLES
+from rango.thumbnails import best_variants
+from rango.versions import CATEGORIES, get_version
 
 register = template.Library()
 
+SIDEBAR_KEY = 'rango:sidebar:{}'
+
 
-@register.inclusion_tag('rango/cats.html')
+@register.simple_tag
 def get_category_list(cat=None):
-    return {'cats': Category.objects.all().order_by('name'),
-            'act_cat': cat, }
+    # the whole list is rendered once per categories version,
+    # only the active category is rendered on each request
+    key = SIDEBAR_KEY.format(get_version(CATEGORIES))
+    sidebar = cache.get(key)
+    if sidebar is None:
+        sidebar = render_to_string('rango/cats.html',
+                                   {'cats': Category.objects.order_by('name').only('name', 'slug')})
+        cache.set(key, sidebar, getattr(settings, 'RANGO_SIDEBAR_CACHE_TIMEOUT', 86400))
+
+    if cat is not None:
+        plain = render_to_string('rango/cats.html', {'cats': [cat]}).strip()
+        active = render_to_string('rango/cats.html', {'cats': [cat], 'act_cat': cat}).strip()
+        sidebar = sidebar.replace(plain, active, 1)
+    return mark_safe(sidebar)
+
+
+@register.inclusion_tag('rango/picture.html')
+def profile_picture(picture, size, alt=''):
+    # smallest thumbnails covering the displayed size, the original until they are made
+    variants = best_variants(picture.name, size)
+    return {
+        'src': settings.MEDIA_URL + (variants.get('jpeg') or picture.name),
+        'webp': settings.MEDIA_URL + variants['webp'] if 'webp' in variants else None,
+        'size': size,
+        'alt': alt,
+    }
+
+
+@register.inclusion_tag('rango/scripts.html')
+def rango_scripts(bundle='js/rango.bundle.js'):
+    # the bundle once collectstatic wrote it, its parts while developing
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', {})
+    if not settings.DEBUG and bundle in hashed_files:
+        return {'scripts': [bundle]}
+    return {'scripts': BUNDLES[bundle]}
@@ -1,8 +1,62 @@
-from django.test import TestCase
-from rango.models import Category
+import asyncio
+import gzip
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.template import Context, Template
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rango.leaderboards import Leaderboard, top_categories, top_pages
+from rango.metrics import EXITED_SNAPSHOT, fold_snapshot, metrics, render_prometheus
+from rango.asgi import DjangoASGIApplication
+from rango.checks import check_shared_cache
+from rango.exporters import iter_lines
+from rango.fulltext import build_match_expression, search_local
+from rango.jobs import enqueue, requeue_stale, task, work
+from rango.middleware import PIN_COOKIE, ReadYourWritesMiddleware
+from rango.models import Category, Job, Page, UserProfile
+from rango.query_plans import explain, plan_problems
+from rango.prefix_index import CategoryEntry, PrefixIndex, category_index
+from rango.management.commands.sync_replicas import copy_database
+from rango.routers import PrimaryReplicaRouter, read_from_primary, unpin
+from rango.search_cache import QueryCache, search_cache
+from rango.views import cached_search
+from rango.sqlite import current_pragmas
+from rango.thumbnails import make_thumbnails, thumbnail_name
+from rango.tracking import page_views
+from rango.versions import INDEX, bump_versions
+from rango.webhose_search import ConnectionPool, run_queries, run_query
+from rango.webhose_stub import StubWebhoseServer
 from django.core.urlresolvers import reverse
 
 
+def reset_rango_caches():
+    """
+    Forget what in process caches learned from the data of previous tests,
+    which test transactions roll back without sending any signal
+    """
+    cache.clear()
+    category_index.invalidate()
+    top_categories.invalidate()
+    top_pages.invalidate()
+    metrics.clear()
+
+
 class CategoryMethodTests(TestCase):
     def test_ensure_views_are_positive(self):
         """
@@ -25,6 +79,9 @@ class CategoryMethodTests(TestCase):
 
 
 class IndexViewTests(TestCase):
+    def setUp(self):
+        reset_rango_caches()
+
     def test_index_view_with_no_categories(self):
         """
         If no questions exist, an appropriate message should be displayed.
@@ -33,3 +90,1091 @@ class IndexViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "There are no categories present.")
         self.assertQuerysetEqual(response.context['categories'], [])
+
+
+@override_settings(RANGO_PAGE_VIEWS_FLUSH_INTERVAL=3600)
+class TrackUrlTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Python')
+        self.page = Page.objects.create(category=category, title='Docs',
+                                        url='http://docs.python.org/', views=3)
+
+    def tearDown(self):
+        page_views.flush()
+
+    def test_track_url_buffers_views(self):
+        """
+        Clicks are counted in memory and written as a single update on flush,
+        a warm redirect does not touch the database at all
+        """
+        url = reverse('rango:goto', args=[self.page.id])
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertRedirects(response, self.page.url, fetch_redirect_response=False)
+        self.assertEqual(Page.objects.get(pk=self.page.id).views, 3)
+
+        page_views.flush()
+        self.assertEqual(Page.objects.get(pk=self.page.id).views, 5)
+
+    def test_track_url_unknown_page(self):
+        response = self.client.get(reverse('rango:goto', args=[self.page.id + 1]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_redirect_follows_url_change(self):
+        url = reverse('rango:goto', args=[self.page.id])
+        self.client.get(url)
+        self.page.url = 'http://www.python.org/'
+        self.page.save()
+        response = self.client.get(url)
+        self.assertRedirects(response, 'http://www.python.org/', fetch_redirect_response=False)
+
+
+class QueryCacheTests(SimpleTestCase):
+    def test_hits_and_lru_eviction(self):
+        cache = QueryCache(max_size=2, ttl=60, stale_ttl=0)
+        cache.get('a', lambda: ['a'])
+        cache.get('b', lambda: ['b'])
+        self.assertEqual(cache.get('a', lambda: ['other']), ['a'])
+        cache.get('c', lambda: ['c'])
+        # 'b' was the least recently used entry
+        self.assertEqual(cache.get('b', lambda: ['b2']), ['b2'])
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (1, 4, 2))
+
+    def test_stale_value_served_while_refreshing(self):
+        cache = QueryCache(max_size=2, ttl=0, stale_ttl=60)
+        cache.get('a', lambda: ['old'])
+        refreshed = threading.Event()
+
+        def compute():
+            refreshed.set()
+            return ['new']
+
+        self.assertEqual(cache.get('a', compute), ['old'])
+        self.assertTrue(refreshed.wait(5))
+        self.assertEqual(cache.stats()['stale_hits'], 1)
+
+    def test_concurrent_misses_are_coalesced(self):
+        cache = QueryCache(max_size=2, ttl=60, stale_ttl=0)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return ['result']
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('q', compute)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['result']] * 5)
+        self.assertEqual(cache.stats()['coalesced'], 4)
+
+
+class WebhoseClientTests(SimpleTestCase):
+    def setUp(self):
+        self.server = StubWebhoseServer().start()
+        self.pool = ConnectionPool(self.server.root_url, read_timeout=0.2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def test_run_query_reuses_connection(self):
+        for _ in range(3):
+            results = run_query('django', pool=self.pool)
+            self.assertEqual(len(results), 1)
+            self.assertIn('Harvey Weinstein', results[0]['title'])
+        self.assertEqual(self.server.connections, 1)
+
+    def test_read_timeout_returns_no_results(self):
+        self.server.latency = 0.5
+        self.assertEqual(run_query('django', pool=self.pool), [])
+
+    def test_run_queries_deadline(self):
+        self.server.latency = 0.05
+        results = run_queries(['python', 'django'], pool=self.pool, deadline=2)
+        self.assertEqual(sorted(results), ['django', 'python'])
+        self.assertTrue(all(len(result) == 1 for result in results.values()))
+
+        self.server.latency = 0.15
+        results = run_queries(['python'], pool=self.pool, deadline=0.05)
+        self.assertEqual(results, {'python': []})
+
+    def test_late_queries_do_not_hold_a_worker(self):
+        """
+        The deadline caps the read timeout, well below the pool one
+        """
+        pool = ConnectionPool(self.server.root_url)
+        self.server.latency = 1.0
+        start = time.perf_counter()
+        self.assertEqual(run_query('django', pool=pool, timeout=0.1), [])
+        self.assertLess(time.perf_counter() - start, 0.5)
+        pool.close()
+
+
+class LocalSearchTests(TestCase):
+    def setUp(self):
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+        Page.objects.create(category=self.django, title='Django Rocks', url='http://www.djangorocks.com/')
+        Page.objects.create(category=self.python, title='How to Think like a Computer Scientist',
+                            url='http://www.greenteapress.com/thinkpython/')
+
+    def test_match_expression(self):
+        self.assertEqual(build_match_expression('Django  rocks'), '"django" "rocks"*')
+        self.assertEqual(build_match_expression(' "*" '), '')
+
+    def test_index_follows_model_changes(self):
+        """
+        Categories and pages are indexed on save, renamed and removed
+        with their rows
+        """
+        results = search_local('djan')
+        self.assertEqual([r['title'] for r in results], ['Django', 'Django Rocks'])
+        self.assertEqual(results[0]['link'], reverse('rango:show_category', args=['django']))
+
+        self.django.name = 'Flask'
+        self.django.save()
+        self.assertEqual([r['title'] for r in search_local('django')], ['Django Rocks'])
+
+        self.django.delete()
+        self.assertEqual(search_local('django'), [])
+        self.assertEqual(len(search_local('thinkpython')), 1)
+
+    @override_settings(RANGO_SEARCH_BACKEND='local')
+    def test_search_view_local_backend(self):
+        response = self.client.post(reverse('rango:search'), {'query': 'python'})
+        self.assertContains(response, 'href="{}"'.format(reverse('rango:show_category', args=['python'])))
+
+
+class SuggestCategoryTests(TestCase):
+    def setUp(self):
+        for name in ['Python', 'Pyramid', 'Django', 'pytest']:
+            Category.objects.create(name=name)
+
+    def test_prefix_index_is_case_insensitive(self):
+        self.assertEqual([c.name for c in category_index.search('PY')], ['Pyramid', 'pytest', 'Python'])
+        self.assertEqual([c.name for c in category_index.search('py', 2)], ['Pyramid', 'pytest'])
+        self.assertEqual(category_index.search('flask'), [])
+
+    def test_prefix_index_at_scale(self):
+        names = ['category {:06d}'.format(i) for i in range(100000)]
+        index = PrefixIndex(lambda: [CategoryEntry(name, name) for name in names])
+        self.assertEqual(len(index.search('Category 0999', 8)), 8)
+        with self.assertNumQueries(0):
+            for i in range(1000):
+                results = index.search('category {:04d}'.format(i), 8)
+                self.assertEqual(results[0].name, 'category {:04d}00'.format(i))
+        category_index.search('py')
+        # once loaded, the categories are never queried again
+        with self.assertNumQueries(0):
+            self.assertEqual(category_index.search('py'), category_index.search('PY'))
+
+    def test_json_suggestions(self):
+        url = reverse('rango:suggest_category')
+        self.client.get(url, {'suggestion': 'py', 'format': 'json'})
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'suggestion': 'py', 'format': 'json'})
+        self.assertIn('max-age=60', response['Cache-Control'])
+        self.assertEqual(response.json()['categories'][0],
+                         {'name': 'Pyramid', 'url': reverse('rango:show_category', args=['pyramid'])})
+
+    def test_new_category_is_suggested(self):
+        self.assertEqual(len(category_index.search('dj')), 1)
+        Category.objects.create(name='Django Auth')
+        response = self.client.get(reverse('rango:suggest_category'), {'suggestion': 'dj'})
+        self.assertContains(response, 'Django Auth')
+
+
+class CategorySidebarTests(TestCase):
+    template = Template('{% load rango_template_tags %}{% get_category_list cat %}')
+
+    def setUp(self):
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+
+    def render(self, cat=None):
+        return self.template.render(Context({'cat': cat}))
+
+    def test_sidebar_is_cached_until_categories_change(self):
+        self.render()
+        with self.assertNumQueries(0):
+            sidebar = self.render(self.python)
+        self.assertLess(sidebar.index('Django'), sidebar.index('Python'))
+        self.assertInHTML('<li><strong><a href="/rango/category/python/">Python</a></strong></li>', sidebar)
+        self.assertInHTML('<li><a href="/rango/category/django/">Django</a></li>', sidebar)
+
+        Category.objects.create(name='Flask')
+        self.assertIn('Flask', self.render())
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        reset_rango_caches()
+        self.categories = [Category.objects.create(name='Category {}'.format(i), likes=i)
+                           for i in range(8)]
+        self.pages = [Page.objects.create(category=self.categories[0], title='Page {}'.format(i),
+                                          url='http://example.com/{}'.format(i), views=i)
+                      for i in range(8)]
+        User.objects.create_user('rango', password='rango-password')
+
+    def tearDown(self):
+        page_views.flush()
+
+    def test_index_uses_leaderboards(self):
+        response = self.client.get(reverse('rango:index'))
+        self.assertEqual([c.name for c in response.context['top_categories']],
+                         ['Category 7', 'Category 6', 'Category 5', 'Category 4', 'Category 3'])
+        self.assertEqual([p.title for p in response.context['top_pages']],
+                         ['Page 7', 'Page 6', 'Page 5', 'Page 4', 'Page 3'])
+
+    def test_likes_and_views_move_entries_up(self):
+        top_categories.top(5)
+        self.client.login(username='rango', password='rango-password')
+        url = reverse('rango:like_category')
+        self.client.get(url, {'category_id': self.categories[0].id})
+        self.assertEqual(top_categories.top(1)[0].name, 'Category 7')
+        for _ in range(6):
+            self.client.get(url, {'category_id': self.categories[0].id})
+        response = self.client.get(url, {'category_id': self.categories[0].id})
+        self.assertEqual(response.content, b'8')
+        self.assertEqual([c.name for c in top_categories.top(2)], ['Category 0', 'Category 7'])
+
+        top_pages.top(5)
+        for _ in range(8):
+            self.client.get(reverse('rango:goto', args=[self.pages[1].id]))
+        page_views.flush()
+        with self.assertNumQueries(0):
+            self.assertEqual([p.title for p in top_pages.top(2)], ['Page 1', 'Page 7'])
+
+    def test_deleted_category_leaves_the_board(self):
+        top_categories.top(5)
+        self.categories[7].delete()
+        self.assertEqual(top_categories.top(1)[0].name, 'Category 6')
+
+    def test_changes_of_other_workers_reload_the_board(self):
+        self.assertEqual(top_categories.top(1)[0].name, 'Category 7')
+        # a like served by another process: no signal here, only the version moves
+        Category.objects.filter(pk=self.categories[0].pk).update(likes=100)
+        bump_versions(INDEX)
+        self.assertEqual(top_categories.top(1)[0].name, 'Category 0')
+
+    def test_invalidated_while_reading(self):
+        class RacingLeaderboard(Leaderboard):
+            def rebuild(self, version=None):
+                entries = super(RacingLeaderboard, self).rebuild(version)
+                # another thread saving a category
+                self.invalidate()
+                return entries
+
+        board = RacingLeaderboard(Category, 'likes', ['name', 'slug'])
+        self.assertEqual(board.top(1)[0].name, 'Category 7')
+
+
+class VisitorCookieTests(TestCase):
+    def setUp(self):
+        reset_rango_caches()
+
+    def test_session_written_once_a_day(self):
+        url = reverse('rango:visits_fragment')
+        response = self.client.get(url)
+        self.assertIn('sessionid', response.cookies)
+        self.client.get(url)
+
+        response = self.client.get(url)
+        self.assertNotIn('sessionid', response.cookies)
+        self.assertEqual(response.context['visits'], 1)
+
+        session = self.client.session
+        session['last_visit'] -= 1
+        session.save()
+        response = self.client.get(url)
+        self.assertEqual(response.context['visits'], 2)
+        self.assertIn('sessionid', response.cookies)
+
+    def test_previous_session_format(self):
+        session = self.client.session
+        session['visits'] = 3
+        session['last_visit'] = '2017-10-01 10:00:00.000000'
+        session.save()
+        self.client.cookies['sessionid'] = session.session_key
+        response = self.client.get(reverse('rango:visits_fragment'))
+        self.assertEqual(response.context['visits'], 4)
+        self.assertIsInstance(self.client.session['last_visit'], int)
+
+
+class QueryPlanTests(TestCase):
+    """
+    The queries run by the views on every request must be answered from
+    indexes, without full table scans or temporary sorts
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Category.objects.bulk_create(Category(name='Category {}'.format(i), slug='category-{}'.format(i),
+                                              likes=i % 97) for i in range(1000))
+        category_ids = list(Category.objects.values_list('id', flat=True))
+        Page.objects.bulk_create(Page(category_id=category_ids[i % 1000], title='Page {}'.format(i),
+                                      url='http://example.com/{}'.format(i), views=i % 1013)
+                                 for i in range(20000))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.category = Category.objects.get(slug='category-7')
+
+    def assertIndexed(self, queryset, index):
+        """
+        :param index: name of the index the plan must use, wording of the plan details
+        changes between SQLite versions
+        """
+        plan = explain(queryset)
+        self.assertEqual(plan_problems(plan), [], plan)
+        self.assertIn(index, ' '.join(plan))
+
+    def test_index_queries(self):
+        self.assertIndexed(top_categories.queryset(), 'rango_cat_likes_idx')
+        self.assertIndexed(top_pages.queryset(), 'rango_page_views_idx')
+
+    def test_show_category_queries(self):
+        # the unique constraints on name and slug come with SQLite's own indexes
+        self.assertIndexed(Category.objects.filter(slug='category-7'), 'sqlite_autoindex_rango_category')
+        self.assertIndexed(Page.objects.filter(category=self.category).order_by('-views'),
+                           'rango_page_cat_views_idx')
+
+    def test_sidebar_and_redirect_queries(self):
+        self.assertIndexed(Category.objects.order_by('name').only('name', 'slug'),
+                           'sqlite_autoindex_rango_category')
+        self.assertIndexed(Page.objects.filter(pk=1).values_list('url', flat=True), 'PRIMARY KEY')
+
+    def test_plan_problems(self):
+        plan = explain(Page.objects.order_by('title'))
+        self.assertEqual(len(plan_problems(plan)), 2, plan)
+        self.assertNotIn('INDEX', ' '.join(plan))
+
+
+class GenerateDatasetTests(TestCase):
+    def test_generate_dataset(self):
+        call_command('generate_dataset', categories=30, pages=300, users=10, batch_size=50,
+                     stdout=io.StringIO())
+        self.assertEqual(Category.objects.count(), 30)
+        self.assertEqual(Page.objects.count(), 300)
+        self.assertEqual(User.objects.filter(username__startswith='rango_user_').count(), 10)
+        category = Category.objects.first()
+        self.assertEqual(Category.objects.get(slug=category.slug), category)
+
+
+class ImportCatalogTests(TestCase):
+    def setUp(self):
+        reset_rango_caches()
+        Category.objects.create(name='Python')
+
+    def import_file(self, suffix, content, **options):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        try:
+            call_command('import_catalog', path, stdout=io.StringIO(), **options)
+        finally:
+            os.remove(path)
+
+    def test_import_jsonl(self):
+        self.import_file('.jsonl', '\n'.join([
+            '{"category": "Django", "likes": 12}',
+            '{"category": "python", "title": "Docs", "url": "http://docs.python.org/", "views": 3}',
+            '{"category": "Django", "title": "Tutorial", "url": "http://djangoproject.com/"}',
+            '{"category": "Python!", "title": "PEP 8", "url": "http://python.org/dev/peps/pep-0008/"}',
+        ]), batch_size=2)
+        self.assertEqual(Category.objects.get(name='Django').likes, 12)
+        self.assertEqual(Page.objects.get(title='Docs').category.name, 'Python')
+        self.assertEqual(Page.objects.get(title='Docs').views, 3)
+        # 'python' is taken by the Python category
+        self.assertEqual(Category.objects.get(name='Python!').slug, 'python-2')
+        self.assertEqual([c.name for c in category_index.search('dj')], ['Django'])
+
+    def test_malformed_records_name_their_line(self):
+        with self.assertRaisesMessage(CommandError, 'Line 3: views is not a number'):
+            self.import_file('.csv', 'category,title,url,views\n'
+                                     'Python,Docs,http://docs.python.org/,5\n'
+                                     'Python,PEP 8,http://python.org/,many\n')
+        with self.assertRaisesMessage(CommandError, "Line 2: page 'Docs' has no url"):
+            self.import_file('.jsonl', '{"category": "Python"}\n{"category": "Python", "title": "Docs"}')
+        with self.assertRaisesMessage(CommandError, 'Line 1: no category'):
+            self.import_file('.jsonl', '{"title": "Docs", "url": "http://docs.python.org/"}')
+
+    def test_batches_imported_before_an_error_change_etags(self):
+        url = reverse('rango:show_category', args=['python'])
+        etag = self.client.get(url)['ETag']
+        with self.assertRaises(CommandError):
+            self.import_file('.jsonl', '{"category": "Python", "title": "Docs", "url": "http://docs.python.org/"}\n'
+                                       '{"category": "Python", "title": "PEP 8"}', batch_size=1)
+        self.assertContains(self.client.get(url, HTTP_IF_NONE_MATCH=etag), 'Docs')
+
+    def test_import_into_existing_category_changes_its_etag(self):
+        url = reverse('rango:show_category', args=['python'])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.import_file('.jsonl', '{"category": "Python", "title": "Docs", "url": "http://docs.python.org/"}')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Docs')
+
+    def test_import_csv(self):
+        self.import_file('.csv', 'category,title,url,views\n'
+                                 'Python,Docs,http://docs.python.org/,5\n'
+                                 'Flask,Quickstart,http://flask.pocoo.org/,\n')
+        self.assertEqual(Page.objects.filter(category__name='Flask').count(), 1)
+        self.assertEqual(Page.objects.get(title='Docs').views, 5)
+
+
+class ExportCatalogTests(TestCase):
+    def setUp(self):
+        python = Category.objects.create(name='Python', likes=4)
+        for i in range(5):
+            Page.objects.create(category=python, title='Page {}'.format(i),
+                                url='http://example.com/{}'.format(i), views=i)
+        User.objects.create_user('staff', password='rango-password', is_staff=True)
+
+    def test_keyset_chunks(self):
+        records = [json.loads(line) for line in iter_lines('jsonl', chunk_size=2)]
+        self.assertEqual(len(records), 6)
+        self.assertEqual(records[0], {'type': 'category', 'id': records[0]['id'], 'name': 'Python',
+                                      'slug': 'python', 'views': 0, 'likes': 4})
+        self.assertEqual([r['title'] for r in records[1:]], ['Page {}'.format(i) for i in range(5)])
+
+    def test_export_endpoint_streams_gzip(self):
+        url = reverse('rango:export_catalog')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.login(username='staff', password='rango-password')
+        response = self.client.get(url, {'format': 'csv', 'gzip': '1'})
+        self.assertTrue(response.streaming)
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'type,id,category_id,name,slug,title,url,views,likes')
+        self.assertEqual(len(lines), 7)
+        self.assertIn('attachment; filename="catalog.csv.gz"', response['Content-Disposition'])
+
+
+class LargeTableAdminTests(TestCase):
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'rango-password')
+        self.client.login(username='admin', password='rango-password')
+
+    def create_categories(self, count):
+        Category.objects.bulk_create(Category(name='Category {}'.format(i), slug='category-{}'.format(i))
+                                     for i in range(Category.objects.count(), count))
+        for category in Category.objects.all():
+            Page.objects.bulk_create(Page(category=category, title='Page', url='http://example.com/')
+                                     for _ in range(category.id % 3))
+
+    def changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_constant_query_count(self):
+        url = reverse('admin:rango_category_changelist')
+        self.create_categories(10)
+        _, few = self.changelist_queries(url)
+        self.create_categories(150)
+        response, many = self.changelist_queries(url)
+        self.assertEqual(few, many)
+
+        last = Category.objects.order_by('-id')[99]
+        self.assertEqual(response.context['cl'].result_list[99].page_total, last.page_set.count() or None)
+        self.assertContains(response, '?id__lt={}'.format(last.id))
+        response, _ = self.changelist_queries(url + '?id__lt={}'.format(last.id))
+        self.assertEqual(len(response.context['cl'].result_list), 50)
+
+        _, pages = self.changelist_queries(reverse('admin:rango_page_changelist'))
+        self.assertLess(pages, 10)
+
+
+class ProfileQueryTests(TestCase):
+    """
+    Query counts of the profile pages must not depend on the number of users
+    """
+    user_count = 100000
+
+    @classmethod
+    def setUpTestData(cls):
+        # plain SQL, building 100k model instances would take most of the test run
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO auth_user (username, password, first_name, last_name, email, "
+                "is_superuser, is_staff, is_active, date_joined) "
+                "VALUES (%s, '', '', '', '', 0, 0, 1, '2017-10-01 00:00:00')",
+                [('user{:06d}'.format(i),) for i in range(cls.user_count)])
+            cursor.execute("INSERT INTO rango_userprofile (user_id, website, picture) "
+                           "SELECT id, '', '' FROM auth_user")
+        cls.viewer = User.objects.create_user('viewer', password='rango-password')
+
+    def setUp(self):
+        self.client.login(username='viewer', password='rango-password')
+
+    def test_list_profiles_pages(self):
+        url = reverse('rango:list_profiles')
+        # session, user and one page of profiles with their users
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'per_page': 1000})
+        self.assertEqual(len(response.context['userprofile_list']), 100)
+        self.assertEqual(response.context['next_after'], 'user000099')
+
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'after': 'user099990'})
+        self.assertEqual([p.user.username for p in response.context['userprofile_list']],
+                         ['user{:06d}'.format(i) for i in range(99991, 100000)])
+        self.assertIsNone(response.context['next_after'])
+
+    def test_profile_get_never_writes(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('rango:profile', args=['user000042']))
+        self.assertEqual(response.context['selecteduser'].username, 'user000042')
+
+        with self.assertNumQueries(3):
+            self.client.get(reverse('rango:profile', args=['viewer']))
+        self.assertFalse(UserProfile.objects.filter(user=self.viewer).exists())
+
+        self.client.post(reverse('rango:profile', args=['viewer']), {'website': 'http://viewer.example.com/'})
+        self.assertEqual(UserProfile.objects.get(user=self.viewer).website, 'http://viewer.example.com/')
+
+
+class ThumbnailTests(SimpleTestCase):
+    def setUp(self):
+        from PIL import Image
+        self.media_root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.media_root, 'profile_images'))
+        exif = Image.Exif() if hasattr(Image, 'Exif') else None
+        image = Image.new('RGB', (800, 400), (200, 40, 40))
+        options = {}
+        if exif is not None:
+            exif[0x010f] = 'Rango Camera'
+            options['exif'] = exif.tobytes()
+        image.save(os.path.join(self.media_root, 'profile_images', 'me.jpg'), 'JPEG', **options)
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root)
+
+    def test_thumbnails_fit_and_drop_metadata(self):
+        from PIL import Image
+        written = make_thumbnails('profile_images/me.jpg', self.media_root, [64, 300], ['jpeg'])
+        self.assertEqual(written, ['profile_images/thumbs/me_64.jpg', 'profile_images/thumbs/me_300.jpg'])
+        with Image.open(os.path.join(self.media_root, written[1])) as thumbnail:
+            self.assertEqual(thumbnail.size, (300, 150))
+            self.assertNotIn('exif', thumbnail.info)
+        # existing thumbnails are kept
+        self.assertEqual(make_thumbnails('profile_images/me.jpg', self.media_root, [64, 300], ['jpeg']), [])
+
+    def test_picture_uses_smallest_fitting_thumbnail(self):
+        make_thumbnails('profile_images/me.jpg', self.media_root, [64, 300], ['jpeg'])
+        template = Template('{% load rango_template_tags %}{% profile_picture picture 100 "me" %}')
+        picture = UserProfile(picture='profile_images/me.jpg').picture
+        with override_settings(MEDIA_ROOT=self.media_root, RANGO_THUMBNAIL_SIZES=[64, 300]):
+            html = template.render(Context({'picture': picture}))
+            self.assertIn('src="/media/{}"'.format(thumbnail_name('profile_images/me.jpg', 300, 'jpeg')), html)
+            # not made yet, the original is shown
+            picture = UserProfile(picture='profile_images/new.jpg').picture
+            html = template.render(Context({'picture': picture}))
+            self.assertIn('src="/media/profile_images/new.jpg"', html)
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.media_root, 'profile_images'))
+        self.content = bytes(range(256)) * 1024
+        for name in ('profile_images/me.jpg', 'logo.3f2a9c81d4e5.png'):
+            with open(os.path.join(self.media_root, name), 'wb') as f:
+                f.write(self.content)
+        override = override_settings(MEDIA_ROOT=self.media_root, RANGO_PROTECTED_MEDIA=['profile_images/'])
+        override.enable()
+        self.addCleanup(override.disable)
+        User.objects.create_user('viewer', password='rango-password')
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root)
+
+    def test_protected_media_needs_login(self):
+        response = self.client.get('/media/profile_images/me.jpg')
+        self.assertEqual(response.status_code, 302)
+        self.client.login(username='viewer', password='rango-password')
+        response = self.client.get('/media/profile_images/me.jpg')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+
+    def test_dot_segments_do_not_bypass_protection(self):
+        for url in ('/media/./profile_images/me.jpg', '/media/x/../profile_images/me.jpg'):
+            self.assertEqual(self.client.get(url).status_code, 302, url)
+
+    def test_ranges_and_conditional_requests(self):
+        response = self.client.get('/media/logo.3f2a9c81d4e5.png', HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/262144')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = self.client.get('/media/logo.3f2a9c81d4e5.png', HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+        response = self.client.get('/media/logo.3f2a9c81d4e5.png', HTTP_RANGE='bytes=300000-')
+        self.assertEqual(response.status_code, 416)
+        # the range was for another version of the file
+        response = self.client.get('/media/logo.3f2a9c81d4e5.png', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/media/logo.3f2a9c81d4e5.png', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/media/logo.3f2a9c81d4e5.png',
+                                         HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    @override_settings(RANGO_MEDIA_SENDFILE='x-accel-redirect', RANGO_MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_sendfile_offload(self):
+        self.client.login(username='viewer', password='rango-password')
+        response = self.client.get('/media/profile_images/me.jpg')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/profile_images/me.jpg')
+        self.assertEqual(response.content, b'')
+
+
+class StaticPipelineTests(SimpleTestCase):
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+
+    def test_collectstatic_bundles_hashes_and_compresses(self):
+        template = Template('{% load rango_template_tags %}{% rango_scripts %}')
+        with override_settings(STATIC_ROOT=self.static_root):
+            # not collected yet, the parts are served under their plain names
+            self.assertIn('/static/js/rango_ajax.js', template.render(Context()))
+
+            # the bootstrap css refers to fonts we do not ship
+            with self.assertLogs('rango.storage', 'WARNING') as logs:
+                call_command('collectstatic', interactive=False, verbosity=0)
+            self.assertIn('glyphicons', logs.output[0])
+            with open(os.path.join(self.static_root, 'staticfiles.json')) as f:
+                manifest = json.load(f)['paths']
+            bundle = manifest['js/rango.bundle.js']
+            self.assertRegex(bundle, r'^js/rango\.bundle\.[0-9a-f]{12}\.js$')
+            with open(os.path.join(self.static_root, bundle), 'rb') as f:
+                content = f.read()
+            with gzip.open(os.path.join(self.static_root, bundle + '.gz')) as f:
+                self.assertEqual(f.read(), content)
+            self.assertIn(b'function suggest', content)
+
+            html = template.render(Context())
+            self.assertIn('/static/' + bundle, html)
+            self.assertNotIn('rango_ajax', html)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        reset_rango_caches()
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+
+    def get_etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_unchanged_category_costs_no_query(self):
+        url = reverse('rango:show_category', args=['python'])
+        etag = self.get_etag(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # only the category of the page changes
+        other_etag = self.get_etag(reverse('rango:show_category', args=['django']))
+        Page.objects.create(category=self.python, title='Docs', url='https://docs.python.org/')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(reverse('rango:show_category', args=['django']),
+                                         HTTP_IF_NONE_MATCH=other_etag).status_code, 304)
+
+    def test_likes_and_renames_change_the_etag(self):
+        url = reverse('rango:show_category', args=['python'])
+        etag = self.get_etag(url)
+        # the page is the same for everybody, the user comes in fragments
+        User.objects.create_user('viewer', password='rango-password')
+        self.client.login(username='viewer', password='rango-password')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.get(reverse('rango:like_category'), {'category_id': self.python.id})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # the sidebar of every category page shows the new name
+        etag = self.get_etag(url)
+        self.django.name = 'Flask'
+        self.django.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(RANGO_PAGE_VIEWS_FLUSH_INTERVAL=3600)
+    def test_index_changes_with_views(self):
+        page = Page.objects.create(category=self.python, title='Docs', url='https://docs.python.org/')
+        etag = self.get_etag(reverse('index'))
+        self.assertEqual(self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.get(reverse('rango:goto', args=[page.id]))
+        page_views.flush()
+        self.assertEqual(self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    def test_per_process_cache_is_reported(self):
+        self.assertEqual(check_shared_cache(None), [])
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem, DEBUG=False):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['rango.W001'])
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        reset_rango_caches()
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+
+    def test_page_writes_only_purge_their_category(self):
+        python_url = reverse('rango:show_category', args=['python'])
+        django_url = reverse('rango:show_category', args=['django'])
+        self.client.get(python_url)
+        self.client.get(django_url)
+        with self.assertNumQueries(0):
+            response = self.client.get(python_url)
+        self.assertContains(response, 'No pages currently in category.')
+
+        Page.objects.create(category=self.python, title='Docs', url='https://docs.python.org/')
+        self.assertContains(self.client.get(python_url), 'Docs')
+        with self.assertNumQueries(0):
+            self.client.get(django_url)
+
+    def test_logged_in_users_share_the_page(self):
+        url = reverse('rango:show_category', args=['python'])
+        response = self.client.get(url)
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        User.objects.create_user('viewer', password='rango-password')
+        self.client.login(username='viewer', password='rango-password')
+        response = self.client.get(url)
+        self.assertIsNone(response.context)
+        self.assertNotIn('viewer', response.content.decode())
+
+    def test_hit_ratio_is_reported(self):
+        url = reverse('rango:show_category', args=['python'])
+        self.client.get(url)
+        self.client.get(url)
+        User.objects.create_user('staff', password='rango-password', is_staff=True)
+        self.client.login(username='staff', password='rango-password')
+        stats = self.client.get(reverse('rango:cache_stats')).json()['page_cache']
+        self.assertGreaterEqual(stats['hits'], 1)
+        self.assertGreater(stats['hit_ratio'], 0)
+
+
+class FragmentTests(TestCase):
+    def setUp(self):
+        reset_rango_caches()
+        self.python = Category.objects.create(name='Python')
+        User.objects.create_user('viewer', password='rango-password')
+
+    def test_nav_fragment(self):
+        self.assertContains(self.client.get(reverse('rango:nav_fragment')), 'Sign Up')
+        self.client.login(username='viewer', password='rango-password')
+        response = self.client.get(reverse('rango:nav_fragment'))
+        self.assertContains(response, reverse('rango:profile', args=['viewer']))
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_category_fragment(self):
+        url = reverse('rango:category_fragment', args=['python'])
+        self.assertNotContains(self.client.get(url), 'id="likes"')
+        self.client.login(username='viewer', password='rango-password')
+        response = self.client.get(url, {'query': 'Python'})
+        self.assertContains(response, 'data-catid="{}"'.format(self.python.id))
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(response, 'value="Python"')
+        self.assertEqual(self.client.get(reverse('rango:category_fragment', args=['nope'])).status_code, 404)
+
+
+class DatabaseRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.replica_file = tempfile.NamedTemporaryFile(suffix='.sqlite3')
+        self.addCleanup(self.replica_file.close)
+        databases = dict(settings.DATABASES, replica={'ENGINE': 'django.db.backends.sqlite3',
+                                                      'NAME': self.replica_file.name})
+        override = override_settings(DATABASES=databases, RANGO_DATABASE_REPLICAS=['replica', 'missing'])
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(unpin)
+        unpin()
+        self.router = PrimaryReplicaRouter()
+
+    def test_reads_go_to_replicas_until_a_write(self):
+        self.assertEqual(self.router.db_for_read(Category), 'replica')
+        self.assertEqual(self.router.db_for_write(Category), 'default')
+        self.assertEqual(self.router.db_for_read(Category), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'rango'))
+
+    def test_missing_replica_falls_back_to_primary(self):
+        with override_settings(RANGO_DATABASE_REPLICAS=['missing']):
+            self.assertEqual(self.router.db_for_read(Category), 'default')
+        self.replica_file.close()
+        self.assertEqual(self.router.db_for_read(Category), 'default')
+
+    def test_clients_which_wrote_stay_on_the_primary(self):
+        def view(request):
+            if request.method == 'POST':
+                self.router.db_for_write(Category)
+            return HttpResponse(self.router.db_for_read(Category))
+
+        middleware = ReadYourWritesMiddleware(view)
+        factory = RequestFactory()
+        response = middleware(factory.post('/'))
+        self.assertEqual(response.content, b'default')
+        cookie = response.cookies[PIN_COOKIE]
+        self.assertEqual(middleware(factory.get('/')).content, b'replica')
+
+        request = factory.get('/')
+        request.COOKIES[PIN_COOKIE] = cookie.value
+        self.assertEqual(middleware(request).content, b'default')
+        request.COOKIES[PIN_COOKIE] = str(time.time() - 1)
+        self.assertEqual(middleware(request).content, b'replica')
+
+    def test_cached_pages_read_from_the_primary(self):
+        view = read_from_primary(lambda request: HttpResponse(self.router.db_for_read(Category)))
+        self.assertEqual(view(RequestFactory().get('/')).content, b'default')
+        self.assertEqual(self.router.db_for_read(Category), 'replica')
+
+    def test_replicas_are_copied_without_wal(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        source, target = os.path.join(directory, 'primary.sqlite3'), os.path.join(directory, 'replica.sqlite3')
+        primary = sqlite3.connect(source)
+        primary.execute('PRAGMA journal_mode = wal')
+        primary.execute('CREATE TABLE t (x)')
+        primary.commit()
+        primary.close()
+        open(target + '-wal', 'w').close()
+        copy_database(source, target)
+        replica = sqlite3.connect(target)
+        self.assertEqual(replica.execute('PRAGMA journal_mode').fetchone()[0], 'delete')
+        replica.close()
+        self.assertFalse(os.path.exists(target + '-wal'))
+
+
+class SqlitePragmaTests(TestCase):
+    def test_connections_are_tuned(self):
+        pragmas = current_pragmas(connection, ['busy_timeout', 'synchronous', 'cache_size'])
+        self.assertEqual(pragmas, {'busy_timeout': 10000, 'synchronous': 1, 'cache_size': -64 * 1024})
+
+
+class AsgiSearchTests(SimpleTestCase):
+    def setUp(self):
+        self.server = StubWebhoseServer(latency=0.2).start()
+        self.addCleanup(self.server.stop)
+        self.application = DjangoASGIApplication(threads=2, webhose_url=self.server.root_url)
+        self.addCleanup(self.application.executor.shutdown)
+        search_cache.clear()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    async def post(self, path, query):
+        csrf = 'a' * 32
+        body = 'csrfmiddlewaretoken={}&query={}'.format(csrf, query).encode()
+        scope = {'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'',
+                 'headers': [(b'host', b'testserver'), (b'cookie', 'csrftoken={}'.format(csrf).encode()),
+                             (b'content-type', b'application/x-www-form-urlencoded'),
+                             (b'content-length', str(len(body)).encode())]}
+        messages = [{'type': 'http.request', 'body': body}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await self.application(scope, receive, send)
+        self.headers = dict((name.decode().lower(), value.decode()) for name, value in sent[0]['headers'])
+        return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+    def test_deferred_search_headers_describe_the_page(self):
+        metrics.clear()
+        status, body = self.loop.run_until_complete(self.post(reverse('rango:search'), 'django'))
+        self.assertEqual(status, 200)
+        self.assertEqual(int(self.headers['content-length']), len(body))
+        self.assertIn('x-frame-options', self.headers)
+        # awaited after the middleware returned, still timed under its view
+        self.assertIn(('rango_search_seconds', (('view', 'rango:search'),)), metrics.series())
+
+    def test_searches_wait_on_the_event_loop(self):
+        searches = [self.post(reverse('rango:search'), 'python {}'.format(i)) for i in range(20)]
+        start = time.perf_counter()
+        answers = self.loop.run_until_complete(asyncio.gather(*searches, loop=self.loop))
+        elapsed = time.perf_counter() - start
+        self.assertTrue(all(status == 200 and b'Harvey Weinstein' in body for status, body in answers))
+        # 20 searches of 0.2s with 2 threads would take 2s if they held a thread
+        self.assertLess(elapsed, 1.5)
+        # and went through the search cache
+        self.assertIn('Harvey Weinstein', search_cache.peek(('python 3', 10))[0]['title'])
+
+
+@task('test-flaky', max_attempts=2)
+def flaky(fail):
+    if fail:
+        raise ValueError(fail)
+    return {'ok': True}
+
+
+class JobQueueTests(TestCase):
+    def test_jobs_run_once_and_store_their_result(self):
+        job = enqueue('test-flaky', fail='')
+        self.assertEqual(work(poll_interval=0), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, json.loads(job.result)), (Job.DONE, 1, {'ok': True}))
+        # nothing left to run
+        self.assertEqual(work(poll_interval=0), 0)
+
+    def test_failing_jobs_are_retried_then_failed(self):
+        job = enqueue('test-flaky', fail='boom')
+        work(poll_interval=0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('boom', job.error)
+        # the retry is due after the backoff
+        Job.objects.filter(pk=job.pk).update(run_at=job.created)
+        work(poll_interval=0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_jobs_of_lost_workers(self):
+        retried, killer = enqueue('test-flaky', fail=''), enqueue('test-flaky', fail='')
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        Job.objects.filter(pk=retried.pk).update(status=Job.RUNNING, attempts=1, started=an_hour_ago)
+        Job.objects.filter(pk=killer.pk).update(status=Job.RUNNING, attempts=2, started=an_hour_ago)
+        self.assertEqual(requeue_stale(600), 1)
+        self.assertEqual(Job.objects.get(pk=retried.pk).status, Job.QUEUED)
+        # it killed the worker on each of its attempts
+        self.assertEqual(Job.objects.get(pk=killer.pk).status, Job.FAILED)
+
+    def test_status_endpoint(self):
+        job = enqueue('test-flaky', fail='')
+        url = reverse('rango:job_status', args=[job.key])
+        self.assertEqual(self.client.get(url).json()['status'], Job.QUEUED)
+        work(poll_interval=0)
+        response = self.client.get(url)
+        self.assertEqual(response.json()['result'], {'ok': True})
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(self.client.get(reverse('rango:job_status', args=['0' * 32])).status_code, 404)
+
+    @override_settings(RANGO_SEARCH_DEFERRED=True, RANGO_SEARCH_BACKEND='local')
+    def test_deferred_search(self):
+        Page.objects.create(category=Category.objects.create(name='Python'), title='Python docs',
+                            url='https://docs.python.org/')
+        response = self.client.post(reverse('rango:search'), {'query': 'python'})
+        job = Job.objects.get(name='search')
+        self.assertContains(response, 'data-job="{}"'.format(reverse('rango:job_status', args=[job.key])))
+        work(poll_interval=0)
+        results = self.client.get(reverse('rango:job_status', args=[job.key])).json()['result']
+        self.assertIn('Python docs', [result['title'] for result in results])
+
+    @override_settings(RANGO_SEARCH_DEFERRED=True)
+    def test_deferred_search_answers_from_the_cache(self):
+        search_cache.clear()
+        self.addCleanup(search_cache.clear)
+        search_cache.put(('python', 10), [{'title': 'Python docs', 'link': 'https://docs.python.org/',
+                                           'summary': ''}])
+        response = self.client.post(reverse('rango:search'), {'query': ' Python '})
+        self.assertContains(response, 'Python docs')
+        self.assertFalse(Job.objects.exists())
+
+    def test_search_misses_are_counted_once(self):
+        search_cache.clear()
+        self.addCleanup(search_cache.clear)
+        misses = search_cache.stats()['misses']
+        self.assertIsNone(cached_search('python'))
+        search_cache.get(('python', 10), lambda: [])
+        self.assertEqual(search_cache.stats()['misses'], misses + 1)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        reset_rango_caches()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        override = override_settings(RANGO_METRICS_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.category = Category.objects.create(name='Python')
+
+    def test_server_timing(self):
+        url = reverse('rango:show_category', args=[self.category.slug])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        timing = response['Server-Timing']
+        self.assertIn('total;dur=', timing)
+        self.assertIn('tpl;dur=', timing)
+        self.assertIn('desc="{} queries"'.format(len(queries)), timing)
+
+    @override_settings(RANGO_SEARCH_BACKEND='local')
+    def test_searches_are_timed(self):
+        response = self.client.post(reverse('rango:search'), {'query': 'python'})
+        self.assertIn('search;dur=', response['Server-Timing'])
+        self.assertIn('rango_search_seconds_count{view="rango:search"} 1', render_prometheus(metrics.collect()))
+
+    @override_settings(RANGO_METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_metrics_endpoint_adds_up_workers(self):
+        self.client.get(reverse('rango:about'))
+        self.client.get(reverse('rango:about'))
+        # the snapshot of another worker
+        with open(os.path.join(self.directory, 'rango-1.json'), 'w') as snapshot:
+            json.dump([['rango_responses_total', [['status', '200'], ['view', 'rango:about']], [3]]], snapshot)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode()
+        self.assertIn('rango_request_seconds_count{view="rango:about"} 2', text)
+        self.assertIn('rango_request_seconds_bucket{view="rango:about",le="+Inf"} 2', text)
+        self.assertIn('rango_responses_total{status="200",view="rango:about"} 5', text)
+        self.assertIn('# TYPE rango_sql_queries histogram', text)
+
+    def about_responses(self):
+        key = ('rango_responses_total', (('status', '200'), ('view', 'rango:about')))
+        return metrics.collect().get(key, [0])[0]
+
+    def test_killed_workers_stay_in_the_totals(self):
+        path = os.path.join(self.directory, 'rango-999999.json')
+        with open(path, 'w') as snapshot:
+            json.dump([['rango_responses_total', [['status', '200'], ['view', 'rango:about']], [3]]], snapshot)
+        os.utime(path, (0, 0))
+        self.assertEqual(self.about_responses(), 3)
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, EXITED_SNAPSHOT)))
+        self.assertEqual(self.about_responses(), 3)
+
+    def test_exiting_and_idle_workers_are_counted_once(self):
+        self.client.get(reverse('rango:about'))
+        path = metrics.snapshot_path()
+        metrics.write_snapshot(force=True)
+        metrics.retire(path, os.getpid())
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.about_responses(), 1)
+
+        # an idle worker whose snapshot was folded, then serves again
+        self.client.get(reverse('rango:about'))
+        metrics.write_snapshot(force=True)
+        fold_snapshot(path, os.path.join(self.directory, EXITED_SNAPSHOT))
+        self.client.get(reverse('rango:about'))
+        self.assertEqual(self.about_responses(), 3)
+
+    @override_settings(RANGO_METRICS_TOKEN='s3cret')
+    def test_metrics_endpoint_is_restricted(self):
+        # the address of a reverse proxy on the same host is not enough
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        User.objects.create_user('staff', password='staff-password', is_staff=True)
+        self.client.login(username='staff', password='staff-password')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
@@ -0,0 +1,132 @@
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = 'thumbs'
+JPEG_OPTIONS = {'quality': 85, 'optimize': True, 'progressive': True}
+WEBP_OPTIONS = {'quality': 80, 'method': 4}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def thumbnail_sizes():
+    # bounding box side of each variant, in pixels
+    return sorted(getattr(settings, 'RANGO_THUMBNAIL_SIZES', [64, 300]))
+
+
+def output_formats():
+    # WebP needs Pillow built with libwebp
+    return ['jpeg', 'webp'] if features.check('webp') else ['jpeg']
+
+
+def thumbnail_name(name, size, image_format):
+    """
+    :param name: storage name of the original, e.g. 'profile_images/me.jpg'
+    :param size: bounding box side
+    :param image_format: 'jpeg' or 'webp'
+    :return: storage name of the variant, e.g. 'profile_images/thumbs/me_300.jpg'
+    """
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    extension = 'jpg' if image_format == 'jpeg' else image_format
+    return os.path.join(directory, THUMBNAIL_DIR, '{}_{}.{}'.format(stem, size, extension))
+
+
+def make_thumbnails(name, media_root, sizes, formats, force=False):
+    """
+    Write the thumbnails of an image, without its metadata.
+    Runs in pool processes, so only takes plain arguments.
+    :param name: storage name of the original
+    :param media_root:
+    :param sizes: bounding box sides
+    :param formats: output formats
+    :param force: overwrite existing thumbnails
+    :return: the storage names written
+    """
+    wanted = [(size, image_format, thumbnail_name(name, size, image_format))
+              for size in sizes for image_format in formats]
+    if not force:
+        wanted = [item for item in wanted if not os.path.exists(os.path.join(media_root, item[2]))]
+    if not wanted:
+        return []
+
+    with Image.open(os.path.join(media_root, name)) as original:
+        # JPEGs can be decoded straight at a fraction of their size, much faster for camera pictures
+        largest = max(size for size, image_format, variant in wanted)
+        original.draft('RGB', (largest * 2, largest * 2))
+        # apply the EXIF orientation before the EXIF data is dropped
+        image = ImageOps.exif_transpose(original) if hasattr(ImageOps, 'exif_transpose') else original
+        image = image.convert('RGB')
+
+    written = []
+    for size, image_format, variant in wanted:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size), Image.LANCZOS)
+        # a new image carries pixels only, no EXIF, GPS or ICC data
+        clean = Image.frombytes('RGB', thumbnail.size, thumbnail.tobytes())
+        path = os.path.join(media_root, variant)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, pages never see a half written file
+        tmp_path = path + '.tmp'
+        clean.save(tmp_path, image_format.upper(),
+                   **(JPEG_OPTIONS if image_format == 'jpeg' else WEBP_OPTIONS))
+        os.replace(tmp_path, path)
+        written.append(variant)
+    return written
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=getattr(settings, 'RANGO_THUMBNAIL_WORKERS', 2))
+        return _pool
+
+
+def _log_failure(name):
+    def callback(future):
+        if future.exception() is not None:
+            logger.error("Thumbnails of %s failed", name, exc_info=future.exception())
+    return callback
+
+
+def schedule_thumbnails(name, force=False):
+    """
+    Make the thumbnails of an uploaded image in a pool process, in a
+    job when RANGO_THUMBNAIL_QUEUE is set, or right away when
+    RANGO_THUMBNAIL_WORKERS is 0
+    :param name: storage name of the original
+    :param force:
+    """
+    if getattr(settings, 'RANGO_THUMBNAIL_QUEUE', False):
+        from .jobs import enqueue
+        return enqueue('thumbnails', name=name, force=force)
+    arguments = (name, settings.MEDIA_ROOT, thumbnail_sizes(), output_formats(), force)
+    if getattr(settings, 'RANGO_THUMBNAIL_WORKERS', 2) <= 0:
+        return make_thumbnails(*arguments)
+    get_pool().submit(make_thumbnails, *arguments).add_done_callback(_log_failure(name))
+
+
+def best_variants(name, display_size):
+    """
+    Smallest thumbnails at least display_size wide, in every format
+    :param name: storage name of the original
+    :param display_size: pixels
+    :return: {format: storage name} of the existing variants, empty if none fits
+    """
+    fitting = [size for size in thumbnail_sizes() if size >= display_size]
+    if not fitting:
+        return {}
+    variants = {}
+    for image_format in output_formats():
+        variant = thumbnail_name(name, fitting[0], image_format)
+        if os.path.exists(os.path.join(settings.MEDIA_ROOT, variant)):
+            variants[image_format] = variant
+    return variants
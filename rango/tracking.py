@@ -0,0 +1,154 @@
+import atexit
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+
+from .models import Page
+
+logger = logging.getLogger(__name__)
+
+# SQLite refuses statements with more than 999 bound parameters
+FLUSH_CHUNK_SIZE = 500
+PAGE_URL_KEY = 'rango:page-url:{}'
+
+
+class BufferedCounter(object):
+    """
+    Write-behind counter: increments are summed per primary key in
+    process and written in batches of ``F(field) + n`` updates,
+    so a click never waits on a database write.
+    """
+
+    def __init__(self, model, field, interval_setting, max_pending_setting):
+        self.model = model
+        self.field = field
+        self.interval_setting = interval_setting
+        self.max_pending_setting = max_pending_setting
+        self.listeners = []
+        self._pending = Counter()
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, self.interval_setting, 5)
+
+    @property
+    def max_pending(self):
+        return getattr(settings, self.max_pending_setting, 1000)
+
+    def increment(self, pk, amount=1):
+        """
+        Buffer an increment, flushing inline when the buffer is full
+        or when write-behind is disabled (interval <= 0)
+        :param pk: primary key of the row to increment
+        :param amount:
+        """
+        with self._lock:
+            self._pending[int(pk)] += amount
+            self._pending_total += amount
+            pending_total = self._pending_total
+
+        if self.flush_interval <= 0 or pending_total >= self.max_pending:
+            self.flush()
+        else:
+            self._ensure_flusher()
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self):
+        """
+        Write buffered increments, grouping rows sharing the same delta
+        into a single UPDATE
+        :return: the {pk: amount} increments that were written
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = Counter()
+            self._pending_total = 0
+
+        if not pending:
+            return {}
+
+        by_amount = defaultdict(list)
+        for pk, amount in pending.items():
+            by_amount[amount].append(pk)
+
+        try:
+            with transaction.atomic():
+                for amount, pks in by_amount.items():
+                    for start in range(0, len(pks), FLUSH_CHUNK_SIZE):
+                        self.model.objects.filter(
+                            pk__in=pks[start:start + FLUSH_CHUNK_SIZE]
+                        ).update(**{self.field: F(self.field) + amount})
+        except DatabaseError:
+            logger.exception("Could not flush %s.%s counters, will retry",
+                             self.model.__name__, self.field)
+            with self._lock:
+                self._pending.update(pending)
+                self._pending_total += sum(pending.values())
+            return {}
+
+        for listener in self.listeners:
+            listener(pending)
+        return dict(pending)
+
+    def _ensure_flusher(self):
+        # threads do not survive a fork, so every worker process starts its own
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run,
+                                            name='rango-counter-flusher',
+                                            daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        wake = threading.Event()
+        while True:
+            wake.wait(max(self.flush_interval, 0.1))
+            try:
+                self.flush()
+            finally:
+                # this thread owns its connection, do not leave it open between flushes
+                connection.close()
+
+
+page_views = BufferedCounter(Page, 'views',
+                             'RANGO_PAGE_VIEWS_FLUSH_INTERVAL',
+                             'RANGO_PAGE_VIEWS_MAX_PENDING')
+
+# flush what is left when the worker shuts down
+atexit.register(page_views.flush)
+
+
+def get_page_url(page_id):
+    """
+    Resolve a page id to its url, hitting the database only on a cache miss
+    :param page_id:
+    :return: the url or None if the page does not exist
+    """
+    key = PAGE_URL_KEY.format(page_id)
+    url = cache.get(key)
+    if url is None:
+        url = Page.objects.filter(pk=page_id).values_list('url', flat=True).first()
+        if url is not None:
+            cache.set(key, url, getattr(settings, 'RANGO_PAGE_URL_CACHE_TIMEOUT', 3600))
+    return url
+
+
+def forget_page_url(page_id):
+    cache.delete(PAGE_URL_KEY.format(page_id))
@@ -34,6 +34,13 @@ urlpatterns = [
     url(r'^like/$', views.like_category, name='like_category'),
     url(r'^suggest/$', views.suggest_category, name='suggest_category'),
     url(r'^search/$', views.search, name='search'),
+    url(r'^stats/$', views.cache_stats, name='cache_stats'),
+    url(r'^export/$', views.export_catalog, name='export_catalog'),
+    url(r'^jobs/(?P<key>[0-9a-f]{32})/$', views.job_status, name='job_status'),
+    url(r'^fragments/nav/$', views.nav_fragment, name='nav_fragment'),
+    url(r'^fragments/visits/$', views.visits_fragment, name='visits_fragment'),
+    url(r'^fragments/category/(?P<category_name_slug>[\w\-]+)/$',
+        views.category_fragment, name='category_fragment'),
 ]
 
 """
@@ -0,0 +1,65 @@
+import time
+
+from django.core.cache import cache
+
+VERSION_KEY = 'rango:version:{}'
+# bumped whenever a category is created, renamed or deleted
+CATEGORIES = 'categories'
+# bumped whenever what the index shows may change: categories, pages, likes and views
+INDEX = 'index'
+# bumped whenever a category, one of its pages, its likes or their views change
+CATEGORY = 'category:{}'
+
+
+def _initial_version():
+    # if a version key gets evicted it restarts above every value it had before
+    return int(time.time() * 1000)
+
+
+def get_version(name):
+    """
+    Current value of a content version counter, shared by all workers
+    through the cache
+    :param name:
+    :return: an int
+    """
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key, 0)
+    return version
+
+
+def get_versions(*names):
+    """
+    Current values of several version counters in one cache lookup
+    :param names:
+    :return: a list of ints, in the order of names
+    """
+    keys = [VERSION_KEY.format(name) for name in names]
+    found = cache.get_many(keys)
+    return [found[key] if key in found else get_version(name) for key, name in zip(keys, names)]
+
+
+def bump_version(name):
+    """
+    Move a content version counter forward, invalidating everything
+    cached under the previous value
+    :param name:
+    :return: the new version
+    """
+    key = VERSION_KEY.format(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), None)
+        return get_version(name)
+
+
+def bump_versions(*names):
+    """
+    :param names:
+    :return: {name: new version}
+    """
+    return {name: bump_version(name) for name in names}
@@ -1,14 +1,38 @@
+import hashlib
 from datetime import datetime
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.http import HttpResponse
+from django.core.exceptions import PermissionDenied
+from django.db.models import F
+from django.contrib.auth.views import redirect_to_login
+from django.http import FileResponse, HttpResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import condition, require_safe
 from django.shortcuts import render, get_object_or_404, redirect
 
+from rango.deferred import DeferredSearch, can_defer_search
+from rango.exporters import CONTENT_TYPES, FORMATS, iter_encoded, iter_lines
 from rango.forms import CategoryForm, PageForm, UserProfileForm
-from rango.webhose_search import run_query
-from .constants import integer_default_views_and_likes
-from .models import Category, Page, UserProfile
+from rango.fulltext import search_local
+from rango.jobs import enqueue, job_state
+from rango.leaderboards import index_bumped, top_categories, top_pages
+from rango.media import (CHUNK_SIZE, ONE_YEAR, content_type, file_etag, is_hashed, is_protected, iter_file,
+                         media_file, media_name, parse_range, sendfile_headers)
+from rango.metrics import allowed_to_scrape, metrics as request_metrics, render_prometheus, timed
+from rango.page_cache import cache_page_shell, page_cache_stats
+from rango.prefix_index import category_index
+from rango.routers import read_from_primary
+from rango.search_cache import cached_run_query, normalize_query, search_cache
+from rango.tracking import get_page_url, page_views
+from rango.versions import CATEGORIES, CATEGORY, INDEX, bump_versions, get_versions
+from .constants import integer_default_views_and_likes, profiles_max_per_page, profiles_per_page
+from .models import Category, Job, Page, UserProfile
 
 
 # A helper method
@@ -20,60 +44,93 @@ def get_server_side_cookie(request, cookie, default_val=None):
 
 
 def visitor_cookie_handler(request):
-    visits = int(get_server_side_cookie(request, 'visits', '1'))
-    last_visit_cookie = get_server_side_cookie(request,
-                                               'last_visit',
-                                               str(datetime.now()))
-    last_visit_time = datetime.strptime(last_visit_cookie[:-7],
-                                        '%Y-%m-%d %H:%M:%S')
-
-    # If it's been more than a day since the last visit...
-    if (datetime.now() - last_visit_time).days > 0:
-        visits = visits + 1
-        # Update the last visit cookie now that we have updated the count
-        request.session['last_visit'] = str(datetime.now())
-    else:
+    # visits is an int and last_visit the ordinal of the day of the last
+    # counted visit, so the session is only written once a day
+    today = timezone.localdate().toordinal()
+    visits = get_server_side_cookie(request, 'visits')
+    last_visit = get_server_side_cookie(request, 'last_visit')
+
+    if isinstance(last_visit, str):
+        # stored by a previous version as str(datetime.now())
+        last_visit = datetime.strptime(last_visit[:10], '%Y-%m-%d').toordinal()
+        request.session['last_visit'] = last_visit
+
+    if not visits or not last_visit:
         visits = 1
-        # Set the last visit cookie
-        request.session['last_visit'] = last_visit_cookie
+        request.session['last_visit'] = today
+        request.session['visits'] = visits
+    # If the day changed since the last visit...
+    elif today > last_visit:
+        visits = int(visits) + 1
+        request.session['last_visit'] = today
+        request.session['visits'] = visits
+
+    return visits
+
+
+def content_etag(request, version_names):
+    """
+    ETag of a page showing the content behind some version counters.
+    It does not depend on the user: what is personal comes in fragments.
+    :param request:
+    :param version_names: the versions the page depends on
+    :return: the ETag, or None for requests which are not GET or HEAD
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    parts = get_versions(*version_names)
+    return 'W/"{}"'.format(hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest())
+
+
+def index_etag(request):
+    return content_etag(request, [INDEX, CATEGORIES])
+
+
+def about_etag(request):
+    return content_etag(request, [CATEGORIES])
+
+
+def category_etag(request, category_name_slug):
+    return content_etag(request, [CATEGORY.format(category_name_slug), CATEGORIES])
+
 
-    # Update/set the visits cookie
-    request.session['visits'] = visits
+def revalidate(response):
+    # the same for everybody, any cache may keep it but must ask whether it changed
+    patch_cache_control(response, public=True, max_age=0)
+    return response
 
 
+def personal(response):
+    patch_cache_control(response, private=True, max_age=0)
+    return response
+
+
+@read_from_primary
+@condition(etag_func=index_etag)
+@cache_page_shell(index_etag)
 def index(request):
-    # test cookies
-    request.session.set_test_cookie()
-    # get top 5 categories
-    top_categories = Category.objects.order_by('-likes')[:5]
-    top_pages = Page.objects.order_by('-views')[:5]
-    visitor_cookie_handler(request)
-    # dictionary to pass to the template
+    # dictionary to pass to the template, with the top 5 categories and pages
     context_dict = {'boldmessage': 'Hello from Rango !',
-                    'top_categories': top_categories,
-                    'top_pages': top_pages,
-                    'visits': request.session['visits']}
+                    'top_categories': top_categories.top(5),
+                    'top_pages': top_pages.top(5)}
 
-    # get response early to set cookies
-    return render(request, 'rango/index.html', context=context_dict)
+    return revalidate(render(request, 'rango/index.html', context=context_dict))
 
 
+@read_from_primary
+@condition(etag_func=about_etag)
+@cache_page_shell(about_etag)
 def about(request):
-    # test cookies
-    if request.session.test_cookie_worked():
-        print("TEST COOKIE WORKED!")
-        request.session.delete_test_cookie()
     # dictionary to pass to the template
     context_dict = {'boldmessage': 'Hello from About Rango !'}
 
-    visitor_cookie_handler(request)
-    count = request.session.get('visits', 0)
-    context_dict['visit_count'] = count
-
     # return a rendered response to the client
-    return render(request, 'rango/about.html', context=context_dict)
+    return revalidate(render(request, 'rango/about.html', context=context_dict))
 
 
+@read_from_primary
+@condition(etag_func=category_etag)
+@cache_page_shell(category_etag)
 def show_category(request, category_name_slug):
     context_dict = dict()
 
@@ -90,32 +147,76 @@ def show_category(request, category_name_slug):
         query = request.POST['query'].strip()
 
         if query:
-            # Run our search API function to get the results list!
-            result_list = run_query(query)
             context_dict['query'] = query
+            if can_defer_search(request):
+                return DeferredSearch(query, lambda result_list: personal(render(
+                    request, 'rango/category.html', dict(context_dict, result_list=result_list))))
+            # Run our search API function to get the results list!
+            result_list = cached_run_query(query)
             context_dict['result_list'] = result_list
+        return personal(render(request, 'rango/category.html', context_dict))
 
     # GET
-    return render(request, 'rango/category.html', context_dict)
+    return revalidate(render(request, 'rango/category.html', context_dict))
+
+
+def nav_fragment(request):
+    return personal(render(request, 'rango/fragments/nav.html'))
+
+
+def visits_fragment(request):
+    # test cookies, set for new visitors and checked on their next visit
+    if request.session.test_cookie_worked():
+        request.session.delete_test_cookie()
+    elif not request.session.get('visits'):
+        request.session.set_test_cookie()
+    visits = visitor_cookie_handler(request)
+    return personal(render(request, 'rango/fragments/visits.html', {'visits': visits}))
+
+
+def category_fragment(request, category_name_slug):
+    category = get_object_or_404(Category.objects.only('id', 'slug'), slug=category_name_slug)
+    return personal(render(request, 'rango/fragments/category_controls.html',
+                           {'category': category, 'query': request.GET.get('query', '')}))
 
 
 def get_category_list(max_results=0, starts_with=''):
-    if len(starts_with):
-        cat_list = Category.objects.filter(name__istartswith=starts_with)
-    else:
-        cat_list = Category.objects.all()
-    if max_results > 0:
-        if len(cat_list) > max_results:
-            cat_list = cat_list[:max_results]
-    return cat_list
+    # answered from the in memory prefix index, no query once it is loaded
+    return category_index.search(starts_with, max_results)
 
 
 def suggest_category(request):
-    starts_with = ''
-    if request.method == 'GET':
-        starts_with = request.GET['suggestion']
+    starts_with = request.GET.get('suggestion', '')
     cat_list = get_category_list(8, starts_with)
-    return render(request, 'rango/cats.html', {'cats': cat_list})
+    if request.GET.get('format') == 'json':
+        response = JsonResponse({'categories': [
+            {'name': cat.name, 'url': reverse('rango:show_category', args=[cat.slug])}
+            for cat in cat_list]})
+    else:
+        response = render(request, 'rango/cats.html', {'cats': cat_list})
+    # suggestions are the same for everybody
+    patch_cache_control(response, public=True,
+                        max_age=getattr(settings, 'RANGO_SUGGEST_MAX_AGE', 60))
+    return response
+
+
+def run_search(query):
+    # 'local' answers from our own full-text index, 'webhose' asks the web
+    with timed('search'):
+        if getattr(settings, 'RANGO_SEARCH_BACKEND', 'webhose') == 'local':
+            return search_local(query)
+        return cached_run_query(query)
+
+
+def cached_search(query):
+    """
+    :param query:
+    :return: the fresh cached webhose results of query, or None
+    """
+    if getattr(settings, 'RANGO_SEARCH_BACKEND', 'webhose') != 'webhose':
+        return None
+    # on a miss run_search() or the search job looks the key up again, and counts it
+    return search_cache.peek((normalize_query(query), 10), count_miss=False)
 
 
 def search(request):
@@ -123,17 +224,126 @@ def search(request):
     query = None
     if request.method == 'POST':
         query = request.POST['query'].strip()
-        if query:
-            # Run our Webhose search function to get the results list!
-            result_list = run_query(query)
+        cached = cached_search(query) if query else None
+        if cached is not None:
+            result_list = cached
+        elif query:
+            if getattr(settings, 'RANGO_SEARCH_DEFERRED', False):
+                # answered at once, the page polls the job for the results
+                job = enqueue('search', query=query)
+                return render(request, 'rango/search.html', {'job': job, 'query': query})
+            if can_defer_search(request):
+                return DeferredSearch(query, lambda result_list: render(
+                    request, 'rango/search.html', {'result_list': result_list, 'query': query}))
+            # Run our search function to get the results list!
+            result_list = run_search(query)
     return render(request, 'rango/search.html', {'result_list': result_list, 'query': query})
 
 
+def job_status(request, key):
+    job = get_object_or_404(Job, key=key)
+    response = JsonResponse(job_state(job))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def metrics(request):
+    if not allowed_to_scrape(request):
+        raise PermissionDenied
+    response = HttpResponse(render_prometheus(request_metrics.collect()),
+                            content_type='text/plain; version=0.0.4; charset=utf-8')
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@staff_member_required
+def cache_stats(request):
+    return JsonResponse({'search_cache': search_cache.stats(), 'page_cache': page_cache_stats.stats()})
+
+
+@staff_member_required
+def export_catalog(request):
+    export_format = request.GET.get('format', 'jsonl')
+    if export_format not in FORMATS:
+        export_format = 'jsonl'
+    compress = request.GET.get('gzip') == '1'
+    filename = 'catalog.' + export_format + ('.gz' if compress else '')
+
+    # rows are read, formatted and compressed as the response is sent
+    content_type = 'application/gzip' if compress else CONTENT_TYPES[export_format]
+    response = StreamingHttpResponse(iter_encoded(iter_lines(export_format), compress=compress),
+                                     content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    # /media/./profile_images/... must be as protected as /media/profile_images/...
+    path = media_name(path)
+    protected = is_protected(path)
+    if protected and not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    full_path, stat = media_file(path)
+    etag = file_etag(stat)
+    last_modified = int(stat.st_mtime)
+
+    # the front server sends the file, this worker is free right away
+    offload = sendfile_headers(full_path)
+    if offload:
+        response = HttpResponse(content_type=content_type(path))
+        for header, value in offload.items():
+            response[header] = value
+    else:
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = media_response(request, full_path, stat, etag)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if is_hashed(path):
+        patch_cache_control(response, public=True, max_age=ONE_YEAR, immutable=True)
+    else:
+        patch_cache_control(response, max_age=getattr(settings, 'RANGO_MEDIA_MAX_AGE', 3600),
+                            **{'private' if protected else 'public': True})
+    return response
+
+
+def media_response(request, full_path, stat, etag):
+    size = stat.st_size
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    # a range of another version of the file is no use, send it whole
+    if not if_range or if_range == etag or parse_http_date_safe(if_range) == int(stat.st_mtime):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{}'.format(size)
+            return response
+
+    if byte_range is None:
+        # can be handed to wsgi.file_wrapper by the server
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type(full_path))
+        response.block_size = CHUNK_SIZE
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(iter_file(full_path, start, end - start + 1),
+                                         status=206, content_type=content_type(full_path))
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
 def track_url(request, page_id):
-    page = get_object_or_404(Page, pk=page_id)
-    page.views += 1
-    page.save()
-    return redirect(page.url)
+    url = get_page_url(page_id)
+    if url is None:
+        raise Http404("No Page matches the given query.")
+    # counted in memory, written to the database in batches
+    page_views.increment(page_id)
+    return redirect(url)
 
 
 @login_required
@@ -159,11 +369,16 @@ def register_profile(request):
 @login_required
 def profile(request, username):
     try:
-        user = User.objects.get(username=username)
+        # the profile comes with the user, in the same query
+        user = User.objects.select_related('userprofile').get(username=username)
     except User.DoesNotExist:
         return redirect('rango:index')
 
-    userprofile = UserProfile.objects.get_or_create(user=user)[0]
+    try:
+        userprofile = user.userprofile
+    except UserProfile.DoesNotExist:
+        # not saved until its owner submits the form, a GET never writes
+        userprofile = UserProfile(user=user)
     form = UserProfileForm(
         {'website': userprofile.website, 'picture': userprofile.picture}
     )
@@ -185,9 +400,30 @@ def profile(request, username):
 
 @login_required
 def list_profiles(request):
-    userprofile_list = UserProfile.objects.all()
+    # keyset pagination on the username, ?after=<last username of the previous page>
+    try:
+        per_page = int(request.GET.get('per_page', profiles_per_page))
+    except ValueError:
+        per_page = profiles_per_page
+    per_page = min(max(per_page, 1), profiles_max_per_page)
+    after = request.GET.get('after', '')
+
+    userprofiles = (UserProfile.objects.select_related('user')
+                    .only('id', 'user__id', 'user__username')
+                    .order_by('user__username'))
+    if after:
+        userprofiles = userprofiles.filter(user__username__gt=after)
+    # one more row than displayed tells whether there is a next page
+    userprofile_list = list(userprofiles[:per_page + 1])
+    next_after = None
+    if len(userprofile_list) > per_page:
+        userprofile_list = userprofile_list[:per_page]
+        next_after = userprofile_list[-1].user.username
+
     return render(request, 'rango/list_profiles.html',
-                  {'userprofile_list': userprofile_list}
+                  {'userprofile_list': userprofile_list,
+                   'next_after': next_after,
+                   'per_page': per_page}
                   )
 
 
@@ -197,11 +433,15 @@ def like_category(request):
         cat_id = request.GET['category_id']
         likes = 0
         if cat_id:
-            cat = Category.objects.get(id=int(cat_id))
-            if cat:
-                likes = cat.likes + 1
-                cat.likes = likes
-                cat.save()
+            # increment in the database, concurrent likes are not lost
+            Category.objects.filter(id=int(cat_id)).update(likes=F('likes') + 1)
+            row = Category.objects.filter(id=int(cat_id)).values_list(*top_categories.fields).first()
+            if row is None:
+                raise Http404("No Category matches the given query.")
+            top_categories.offer([row])
+            entry = top_categories.entry_class(*row)
+            index_bumped(bump_versions(INDEX, CATEGORY.format(entry.slug))[INDEX])
+            likes = entry.likes
         return HttpResponse(likes)
 
 
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import ssl
+import urllib.parse
+
+from rango.search_cache import normalize_query, search_cache
+from rango.webhose_search import (CONNECT_TIMEOUT, READ_TIMEOUT, WEBHOSE_ROOT_URL, WebhoseError,
+                                  parse_webhose_response, webhose_query_string)
+
+logger = logging.getLogger(__name__)
+
+# searches being awaited, shared by the requests asking for the same one
+_in_flight = {}
+
+
+def _dechunk(body):
+    chunks = []
+    while True:
+        size_line, _, body = body.partition(b'\r\n')
+        size = int(size_line.split(b';')[0], 16)
+        if size == 0:
+            return b''.join(chunks)
+        chunks.append(body[:size])
+        body = body[size + 2:]
+
+
+async def fetch(url, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+    """
+    GET a url on the event loop, one connection per request
+    :param url:
+    :param connect_timeout: seconds
+    :param read_timeout: seconds for the whole answer
+    :return: (status, body)
+    :raise WebhoseError: on network or HTTP errors
+    """
+    parts = urllib.parse.urlsplit(url)
+    secure = parts.scheme == 'https'
+    port = parts.port or (443 if secure else 80)
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(parts.hostname, port, ssl=ssl.create_default_context() if secure else None),
+            connect_timeout)
+    except (OSError, asyncio.TimeoutError) as e:
+        raise WebhoseError('request failed: {!r}'.format(e))
+
+    target = parts.path + ('?' + parts.query if parts.query else '')
+    writer.write('GET {} HTTP/1.1\r\nHost: {}\r\nAccept: application/json\r\nConnection: close\r\n\r\n'
+                 .format(target, parts.netloc).encode('latin-1'))
+    try:
+        answer = await asyncio.wait_for(reader.read(), read_timeout)
+    except (OSError, asyncio.TimeoutError) as e:
+        raise WebhoseError('request failed: {!r}'.format(e))
+    finally:
+        writer.close()
+
+    head, _, body = answer.partition(b'\r\n\r\n')
+    try:
+        status_line, *header_lines = head.decode('latin-1').split('\r\n')
+        status = int(status_line.split()[1])
+        headers = dict((name.strip().lower(), value.strip())
+                       for name, _, value in (line.partition(':') for line in header_lines))
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = _dechunk(body)
+    except (ValueError, IndexError) as e:
+        raise WebhoseError('unexpected answer: {!r}'.format(e))
+    return status, body
+
+
+async def run_query_async(search_terms, size=10, root_url=WEBHOSE_ROOT_URL):
+    """
+    run_query on the event loop: waiting for webhose costs a coroutine, not a thread
+    :param search_terms:
+    :param size:
+    :param root_url:
+    :return: a list of results, empty if the API failed
+    """
+    try:
+        status, body = await fetch('{}?{}'.format(root_url, webhose_query_string(search_terms, size)))
+        return parse_webhose_response(status, body)
+    except WebhoseError as e:
+        logger.warning("Error when querying the Webhose API for %r: %s", search_terms, e)
+        return []
+
+
+async def cached_run_query_async(search_terms, size=10, root_url=WEBHOSE_ROOT_URL):
+    """
+    cached_run_query on the event loop, sharing the search cache of the
+    process, concurrent identical searches waiting on the same request
+    :param search_terms:
+    :param size:
+    :param root_url:
+    :return: a list of results
+    """
+    query = normalize_query(search_terms)
+    key = (query, size)
+    results = search_cache.peek(key)
+    if results is not None:
+        return results
+
+    search = _in_flight.get(key)
+    if search is None:
+        search = _in_flight[key] = asyncio.ensure_future(run_query_async(query, size, root_url))
+        search.add_done_callback(lambda future: _in_flight.pop(key, None))
+    results = await asyncio.shield(search)
+    if results:
+        search_cache.put(key, results)
+    return results
@@ -1,63 +1,243 @@
+import http.client
 import json
+import logging
+import queue
+import socket
+import threading
+import time
 import urllib.parse
-import urllib.request
 import sys
+from concurrent.futures import ThreadPoolExecutor, wait
+
 import webhoseio
 
+logger = logging.getLogger(__name__)
+
+WEBHOSE_ROOT_URL = 'http://webhose.io/search'
+WEBHOSE_KEY_FILE = 'search.key'
+# seconds allowed to open a connection, then to wait for each read
+CONNECT_TIMEOUT = 3.0
+READ_TIMEOUT = 10.0
+# idle keep-alive connections kept per pool
+POOL_SIZE = 10
+
+_webhose_api_key = None
+_key_lock = threading.Lock()
+
+
+class WebhoseError(Exception):
+    """
+    The webhose API could not be reached or answered something unusable
+    """
+
 
 def read_webhose_key():
     """
-    Read the webhose api from a file
+    Read the webhose api from a file, only once per process
     :return: key
     """
-    webhose_api_key = None
+    global _webhose_api_key
 
-    try:
-        with open('search.key', 'r') as f:
-            webhose_api_key = f.readline().strip()
+    if _webhose_api_key is None:
+        with _key_lock:
+            if _webhose_api_key is None:
+                try:
+                    with open(WEBHOSE_KEY_FILE, 'r') as f:
+                        _webhose_api_key = f.readline().strip()
 
-    except:
-        raise IOError('search.key file not found')
+                except OSError:
+                    raise IOError('search.key file not found')
 
-    return webhose_api_key
+    return _webhose_api_key
 
 
-def run_query(search_terms, size=10):
+class ConnectionPool(object):
+    """
+    Keep-alive HTTP(S) connections to a single host, reused across requests
+    and threads, with separate connect and read timeouts
+    """
+
+    def __init__(self, root_url, size=POOL_SIZE,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+        parts = urllib.parse.urlsplit(root_url)
+        self.connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                                 else http.client.HTTPConnection)
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path or '/'
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _checkout(self, connect_timeout):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self.connection_class(self.host, self.port,
+                                         timeout=connect_timeout), False
+
+    def _checkin(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def get(self, query_string, timeout=None):
+        """
+        GET the pool path with the given query string
+        :param query_string:
+        :param timeout: seconds left to the caller, caps the connect and read timeouts
+        :return: (status, body bytes)
+        """
+        url = '{}?{}'.format(self.path, query_string)
+        connect_timeout, read_timeout = self.connect_timeout, self.read_timeout
+        if timeout is not None:
+            connect_timeout, read_timeout = min(connect_timeout, timeout), min(read_timeout, timeout)
+        while True:
+            conn, reused = self._checkout(connect_timeout)
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                    conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                # reused connections keep the timeout of their previous caller
+                conn.sock.settimeout(read_timeout)
+                conn.request('GET', url, headers={'Accept': 'application/json'})
+                response = conn.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                # the server dropped an idle keep-alive connection, try a fresh one
+                if reused:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._checkin(conn)
+            return response.status, body
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+webhose_pool = ConnectionPool(WEBHOSE_ROOT_URL)
+_batch_executor = ThreadPoolExecutor(max_workers=POOL_SIZE)
+
+
+def webhose_query_string(search_terms, size=10):
     """
-    return a list of results from the webhose api
     :param search_terms:
     :param size:
-    :return:
+    :return: the query string of a webhose search, with our key
     """
     webhose_api_key = read_webhose_key()
 
     if not webhose_api_key:
         raise KeyError('Webhose key not found')
 
-    root_url = 'http://webhose.io/search'
-    query_string = urllib.parse.quote(search_terms)
-    search_url = ('{root_url}?token={key}&format=json&q={query}'
-                  '&sort=relevancy&size={size}').format(
-        root_url=root_url,
-        key=webhose_api_key,
-        query=query_string,
-        size=size)
+    return urllib.parse.urlencode([('token', webhose_api_key),
+                                   ('format', 'json'),
+                                   ('q', search_terms),
+                                   ('sort', 'relevancy'),
+                                   ('size', size)])
+
 
-    results = []
+def parse_webhose_response(status, body):
+    """
+    :param status: HTTP status of the answer
+    :param body: bytes
+    :return: list of {'title', 'link', 'summary'} dicts
+    :raise WebhoseError: on HTTP or payload errors
+    """
+    if status != 200:
+        raise WebhoseError('unexpected HTTP status {}'.format(status))
+
+    try:
+        json_response = json.loads(body.decode('utf-8'))
+        return [{'title': post['title'],
+                 'link': post['url'],
+                 'summary': post['text'][:200]}
+                for post in json_response['posts']]
+    except (ValueError, KeyError, TypeError) as e:
+        raise WebhoseError('unexpected payload: {!r}'.format(e))
+
+
+def query_webhose(search_terms, size=10, pool=None, timeout=None):
+    """
+    return a list of results from the webhose api
+    :param search_terms:
+    :param size:
+    :param pool: the ConnectionPool to use, webhose_pool by default
+    :param timeout: seconds, at most the pool timeouts
+    :return: list of {'title', 'link', 'summary'} dicts
+    :raise WebhoseError: on network, HTTP or payload errors
+    """
+    query_string = webhose_query_string(search_terms, size)
+    try:
+        status, body = (pool or webhose_pool).get(query_string, timeout)
+    except (OSError, http.client.HTTPException) as e:
+        raise WebhoseError('request failed: {!r}'.format(e))
+
+    return parse_webhose_response(status, body)
+
+
+def run_query(search_terms, size=10, pool=None, timeout=None):
+    """
+    return a list of results from the webhose api, empty if the API failed
+    :param search_terms:
+    :param size:
+    :param pool:
+    :param timeout:
+    :return:
+    """
     try:
-        response = urllib.request.urlopen(search_url).read().decode('utf-8')
-        json_response = json.loads(response)
+        return query_webhose(search_terms, size, pool, timeout)
+    except WebhoseError as e:
+        logger.warning("Error when querying the Webhose API for %r: %s", search_terms, e)
+        return []
+
+
+def _run_query_until(expires, search_terms, size, pool):
+    # cancel() cannot stop a running future: its socket gives up with the batch instead
+    remaining = expires - time.monotonic()
+    if remaining <= 0:
+        return []
+    return run_query(search_terms, size, pool, timeout=remaining)
 
-        for post in json_response['posts']:
-            results.append({
-                'title': post['title'],
-                'link': post['url'],
-                'summary': post['text'][:200]
-            })
 
-    except:
-        print("Error when querying the Webhose API")
+def run_queries(queries, size=10, deadline=5.0, pool=None):
+    """
+    run several queries concurrently, giving up on the ones still
+    running after deadline seconds
+    :param queries: iterable of search terms
+    :param size:
+    :param deadline: seconds
+    :param pool:
+    :return: {search terms: results}, empty results for failures and late queries
+    """
+    expires = time.monotonic() + deadline
+    futures = {query: _batch_executor.submit(_run_query_until, expires, query, size, pool)
+               for query in set(queries)}
+    wait(futures.values(), timeout=deadline)
 
+    results = {}
+    for query, future in futures.items():
+        results[query] = []
+        if not future.done():
+            future.cancel()
+            logger.warning("Webhose query %r missed the %ss deadline", query, deadline)
+        elif future.exception() is not None:
+            logger.error("Webhose query %r failed", query, exc_info=future.exception())
+        else:
+            results[query] = future.result()
     return results
 
 
@@ -0,0 +1,62 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+EXAMPLE_RESULT_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   'webhose_search_result_example.json')
+
+
+class StubWebhoseServer(ThreadingMixIn, HTTPServer):
+    """
+    Local stand-in for the webhose search API replaying the example
+    result file after an injected latency, with HTTP/1.1 keep-alive
+    """
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, address=('127.0.0.1', 0)):
+        with open(EXAMPLE_RESULT_FILE, 'rb') as f:
+            self.payload = f.read()
+        self.latency = latency
+        self.connections = 0
+        super(StubWebhoseServer, self).__init__(address, StubWebhoseHandler)
+
+    @property
+    def root_url(self):
+        return 'http://{}:{}/search'.format(*self.server_address)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubWebhoseHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes, do not let them wait on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super(StubWebhoseHandler, self).setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.server.payload)))
+        self.end_headers()
+        try:
+            self.wfile.write(self.server.payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up waiting, as timeout benchmarks expect it to
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
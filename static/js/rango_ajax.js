@@ -1,12 +1,65 @@
 $(document).ready(function() {
 
-    $.get('/rango/suggest/', {suggestion: ''}, function(data){
-        $('#cats').html(data);
+    var suggestionRequest = null;
+    var suggestionTimer = null;
+
+    // ask for the categories starting with query, dropping any answer still pending
+    function suggest(query) {
+        if (suggestionRequest) {
+            suggestionRequest.abort();
+        }
+        suggestionRequest = $.getJSON('/rango/suggest/', {suggestion: query, format: 'json'}, function(data){
+            var items = $.map(data.categories, function(cat){
+                return $('<li>').append($('<a>').attr('href', cat.url).text(cat.name));
+            });
+            $('#cats').empty().append(items);
+        }).always(function(){
+            suggestionRequest = null;
+        });
+    }
+
+    suggest('');
+
+    // the parts of the page depending on the user, the rest is the same for everybody
+    $('[data-fragment]').each(function(){
+        $(this).load($(this).attr('data-fragment'));
     });
 
     console.log('AJAX script Ready !');
 
-    $('#likes').click(function(){
+    // a search running in the job queue: ask for its results until they are in,
+    // waiting longer after each failed request
+    function pollJob(container, failures) {
+        failures = failures || 0;
+        $.getJSON(container.attr('data-job'), function(job){
+            if (job.status === 'done') {
+                var items = $.map(job.result, function(result){
+                    return $('<div class="list-group-item">').append(
+                        $('<h4 class="list-group-item-heading">').append(
+                            $('<a>').attr('href', result.link).text(result.title)));
+                });
+                container.empty().append($('<h3>').text('Results'),
+                                         $('<div class="list-group">').append(items));
+            } else if (job.status === 'failed') {
+                container.text('The search failed, please try again.');
+            } else {
+                setTimeout(function(){ pollJob(container); }, job.retry_after * 1000);
+            }
+        }).fail(function(xhr){
+            if (xhr.status === 404 || failures >= 5) {
+                container.text('The search results could not be loaded, please try again.');
+            } else {
+                setTimeout(function(){ pollJob(container, failures + 1); }, 1000 * Math.pow(2, failures));
+            }
+        });
+    }
+
+    $('[data-job]').each(function(){
+        pollJob($(this));
+    });
+
+    // delegated, the like button arrives with the category fragment
+    $(document).on('click', '#likes', function(){
         console.log('Like button clicked');
         var catid;
         catid = $(this).attr("data-catid");
@@ -18,12 +71,14 @@ $(document).ready(function() {
         });
     });
 
+    // wait for a pause in typing instead of sending a request on every key
     $('#suggestion').keyup(function(){
-        console.log('looking for suggestions');
         var query;
         query = $(this).val();
-        $.get('/rango/suggest/', {suggestion: query}, function(data){
-            $('#cats').html(data);
-        });
+        clearTimeout(suggestionTimer);
+        suggestionTimer = setTimeout(function(){
+            console.log('looking for suggestions');
+            suggest(query);
+        }, 150);
     });
-});
\ No newline at end of file
+});
@@ -0,0 +1,22 @@
+"""
+ASGI config for tango_with_django_project project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+for servers like uvicorn or daphne:
+
+    uvicorn tango_with_django_project.asgi:application
+
+Django 1.11 only speaks WSGI: rango.asgi runs it in a thread pool and awaits
+the webhose searches on the event loop.
+"""
+
+import os
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tango_with_django_project.settings")
+django.setup(set_prefix=False)
+
+from rango.asgi import get_asgi_application  # noqa: E402
+
+application = get_asgi_application()
@@ -46,7 +46,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, to time everything the others do
+    'rango.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'rango.middleware.ReadYourWritesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -59,7 +62,8 @@ ROOT_URLCONF = 'tango_with_django_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates timing renders for rango.middleware.MetricsMiddleware
+        'BACKEND': 'rango.metrics.TimedDjangoTemplates',
         'DIRS': [TEMPLATE_DIR, ],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -86,6 +90,62 @@ DATABASES = {
     }
 }
 
+# Set on every new SQLite connection: wait up to busy_timeout ms for the write lock
+# instead of failing with "database is locked", let readers run during writes (WAL),
+# sync to disk at checkpoints only, map up to mmap_size bytes of the file and keep
+# up to 64MB of pages in memory (negative cache_size is in KB)
+RANGO_SQLITE_PRAGMAS = {
+    'busy_timeout': 10000,
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+}
+
+# Reads are spread over the RANGO_DATABASE_REPLICAS aliases, writes go to 'default'.
+# A client which wrote reads from 'default' for RANGO_REPLICA_LAG seconds.
+# The cached pages (index, about, show_category) and the leaderboards read from
+# 'default', their versions are bumped there; list_profiles, profile and the other
+# uncached views are the reads actually offloaded to the replicas.
+# To try it locally, copy db.sqlite3 with manage.py sync_replicas [--every 1] after adding:
+# DATABASES['replica'] = {
+#     'ENGINE': 'django.db.backends.sqlite3',
+#     'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+#     'TEST': {'MIRROR': 'default'},
+# }
+# RANGO_DATABASE_REPLICAS = ['replica']
+RANGO_DATABASE_REPLICAS = []
+RANGO_REPLICA_LAG = 5
+DATABASE_ROUTERS = ['rango.routers.PrimaryReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+# The content versions behind the ETags and the cached pages must be seen by every
+# worker: files on the local disk by default, memcached or redis for several hosts.
+# A per process cache (LocMemCache) is only right with a single worker (check rango.W001)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# Sessions
+# 'db' writes a row whenever a session changes, 'cache' keeps sessions in CACHES only
+# (must then be shared by all workers), 'cached_db' reads through the cache and
+# writes to the database, 'signed_cookies' keeps them in the client
+RANGO_SESSION_STORE = 'db'
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[RANGO_SESSION_STORE]
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -124,6 +184,64 @@ LOGIN_REDIRECT_URL = '/rango/'
 # and are trying to access pages requiring authentication
 LOGIN_URL = '/accounts/login/'
 
+# Page views counted by the goto redirect are buffered in each worker
+# and written every RANGO_PAGE_VIEWS_FLUSH_INTERVAL seconds (0 writes on every click),
+# or as soon as RANGO_PAGE_VIEWS_MAX_PENDING clicks are waiting
+RANGO_PAGE_VIEWS_FLUSH_INTERVAL = 5
+RANGO_PAGE_VIEWS_MAX_PENDING = 1000
+# How long the goto redirect remembers a page url (seconds)
+RANGO_PAGE_URL_CACHE_TIMEOUT = 3600
+
+# Each worker keeps the RANGO_LEADERBOARD_SIZE most liked categories and most viewed
+# pages, reloaded every RANGO_LEADERBOARD_REFRESH seconds to see other workers' changes
+RANGO_LEADERBOARD_SIZE = 10
+RANGO_LEADERBOARD_REFRESH = 60
+
+# How long a rendered category sidebar is kept (seconds), a category change replaces it anyway
+RANGO_SIDEBAR_CACHE_TIMEOUT = 86400
+
+# How long pages rendered for anonymous users are kept (seconds), any change to
+# what they show makes them be rendered again anyway
+RANGO_PAGE_CACHE_TIMEOUT = 600
+
+# How long browsers may reuse category suggestions (seconds)
+RANGO_SUGGEST_MAX_AGE = 60
+
+# Backend of the search page: 'webhose' for the web, 'local' for our own
+# categories and pages (full-text index, rebuilt with manage.py rebuild_search_index)
+RANGO_SEARCH_BACKEND = 'webhose'
+
+# Searches are run by the job queue (manage.py run_job_workers) and the search page
+# polls for the results every RANGO_JOB_POLL_INTERVAL seconds, instead of waiting
+RANGO_SEARCH_DEFERRED = False
+RANGO_JOB_POLL_INTERVAL = 1
+# Job worker processes started by run_job_workers
+RANGO_JOB_WORKERS = 2
+
+# Worker threads of the ASGI application (tango_with_django_project/asgi.py) running
+# Django code, webhose searches are awaited on its event loop without one
+RANGO_ASGI_THREADS = 10
+
+# Requests are timed per URL name (rango.middleware.MetricsMiddleware), with a
+# Server-Timing header unless RANGO_SERVER_TIMING is False.
+# /metrics shows them to staff, to RANGO_METRICS_ALLOWED_IPS (not behind a proxy on
+# the same host, every client comes from 127.0.0.1 there) and to scrapers sending
+# "Authorization: Bearer <RANGO_METRICS_TOKEN>".
+# With RANGO_METRICS_DIR set, each worker writes its histograms there every
+# RANGO_METRICS_SNAPSHOT_INTERVAL seconds and /metrics adds them up: give every
+# deployment a directory of its own. None reports the answering process only.
+RANGO_SERVER_TIMING = True
+RANGO_METRICS_ALLOWED_IPS = []
+RANGO_METRICS_TOKEN = None
+RANGO_METRICS_DIR = None
+RANGO_METRICS_SNAPSHOT_INTERVAL = 5
+
+# Webhose search results are kept per worker for RANGO_SEARCH_CACHE_TTL seconds,
+# then served stale for up to RANGO_SEARCH_CACHE_STALE_TTL more while refreshed
+RANGO_SEARCH_CACHE_SIZE = 256
+RANGO_SEARCH_CACHE_TTL = 300
+RANGO_SEARCH_CACHE_STALE_TTL = 3600
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.11/topics/i18n/
 
@@ -142,6 +260,28 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [STATIC_DIR, ]
+# collectstatic writes content hashed names, the rango script bundle and .gz/.br siblings
+# here: let the front server send them with a one year max-age (nginx gzip_static on)
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'rango.storage.RangoStaticFilesStorage'
 
 MEDIA_ROOT = MEDIA_DIR
 MEDIA_URL = '/media/'
+
+# Media below these prefixes is only served to logged in users
+RANGO_PROTECTED_MEDIA = ['profile_images/']
+# Once access is checked, hand the transfer over to the front server: None sends files
+# from Django, 'x-sendfile' for Apache/lighttpd, 'x-accel-redirect' for nginx with an
+# internal location RANGO_MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT
+RANGO_MEDIA_SENDFILE = None
+RANGO_MEDIA_ACCEL_PREFIX = '/protected-media/'
+# How long browsers may reuse media (seconds), names with a content hash are kept a year
+RANGO_MEDIA_MAX_AGE = 3600
+
+# Profile pictures are shrunk to fit each of RANGO_THUMBNAIL_SIZES (pixels) as JPEG,
+# plus WebP when Pillow supports it, by RANGO_THUMBNAIL_WORKERS processes
+# (0 makes them while saving the profile)
+RANGO_THUMBNAIL_SIZES = [64, 300]
+RANGO_THUMBNAIL_WORKERS = 2
+# Make them in the job queue instead (manage.py run_job_workers)
+RANGO_THUMBNAIL_QUEUE = False
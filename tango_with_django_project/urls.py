@@ -13,10 +13,11 @@ Including another URLconf
     1. Import the include() function: from django.conf.urls import url, include
     2. Add a URL to urlpatterns:  url(r'^blog/', include('blog.urls'))
 """
+import re
+
 from django.conf.urls import url, include
 from django.contrib import admin
 from django.conf import settings
-from django.conf.urls.static import static
 from django.urls import reverse
 
 from rango import views as rango_views, urls as rango_urls
@@ -33,6 +34,9 @@ class MyRegistrationView(RegistrationView):
 urlpatterns = [url(r'^$', rango_views.index, name='index'),
                url(r'^rango/', include(rango_urls)),
                url(r'^admin/', admin.site.urls),
+               url(r'^metrics$', rango_views.metrics, name='metrics'),
                url(r'^accounts/register/$', MyRegistrationView.as_view(), name='registration_register'),
                url(r'^accounts/', include('registration.backends.simple.urls')),
-               ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+               url(r'^{}(?P<path>.+)$'.format(re.escape(settings.MEDIA_URL.lstrip('/'))),
+                   rango_views.serve_media, name='media'),
+               ]